@@ -0,0 +1,117 @@
+# async_db.py
+#
+# Async sloj nad sinkronim supabase-py klijentom. Svaki poziv ide u zaseban,
+# ograničen thread pool tako da PostgREST round trip ne blokira event loop
+# (i ostale webhookove koji se upravo obrađuju).
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import state_memory
+import supabase_service
+from metrics import DB_SECONDS
+
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "16"))
+
+_executor: ThreadPoolExecutor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+    return _executor
+
+
+async def run_db(fn, *args, **kwargs):
+    """Izvrši sinkroni DB poziv u DB thread poolu"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), partial(fn, *args, **kwargs))
+
+
+def shutdown_db_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+# ========================
+# User state
+# ========================
+
+async def set_state(phone, profession, step, business_id):
+    with DB_SECONDS.time(op="set_state"):
+        return await run_db(state_memory.set_state, phone, profession, step, business_id)
+
+
+async def get_state(phone):
+    with DB_SECONDS.time(op="get_state"):
+        return await run_db(state_memory.get_state, phone)
+
+
+async def update_step(phone, new_step):
+    with DB_SECONDS.time(op="update_step"):
+        return await run_db(state_memory.update_step, phone, new_step)
+
+
+async def pop_state(phone, step=None):
+    with DB_SECONDS.time(op="pop_state"):
+        return await run_db(state_memory.pop_state, phone, step)
+
+
+async def clear_state(phone):
+    with DB_SECONDS.time(op="clear_state"):
+        return await run_db(state_memory.clear_state, phone)
+
+
+async def purge_expired_states(batch: int):
+    with DB_SECONDS.time(op="purge_expired_states"):
+        return await run_db(state_memory.purge_expired_states, batch)
+
+
+async def count_states():
+    with DB_SECONDS.time(op="count_states"):
+        return await run_db(state_memory.count_states)
+
+# ========================
+# Business / requests
+# ========================
+
+async def get_business_by_id(business_id: str):
+    with DB_SECONDS.time(op="get_business_by_id"):
+        return await run_db(supabase_service.get_business_by_id, business_id)
+
+
+async def insert_requests(rows: list):
+    with DB_SECONDS.time(op="insert_requests"):
+        return await run_db(supabase_service.insert_requests, rows)
+
+
+async def consume_request_quota(business_id: str, amount: int = 1):
+    with DB_SECONDS.time(op="consume_request_quota"):
+        return await run_db(supabase_service.consume_request_quota, business_id, amount)
+
+
+async def refund_request_quota(business_id: str, amount: int = 1):
+    with DB_SECONDS.time(op="refund_request_quota"):
+        return await run_db(supabase_service.refund_request_quota, business_id, amount)
+
+
+async def get_subscription_usage(business_id: str):
+    with DB_SECONDS.time(op="get_subscription_usage"):
+        return await run_db(supabase_service.get_subscription_usage, business_id)
+
+# ========================
+# Background jobs
+# ========================
+
+async def acquire_job_lease(name: str, holder: str, ttl_seconds: int):
+    with DB_SECONDS.time(op="acquire_job_lease"):
+        return await run_db(supabase_service.acquire_job_lease, name, holder, ttl_seconds)
+
+
+async def sweep_subscription_renewals():
+    with DB_SECONDS.time(op="sweep_subscription_renewals"):
+        return await run_db(supabase_service.sweep_subscription_renewals)
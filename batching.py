@@ -0,0 +1,88 @@
+# batching.py
+#
+# Generički micro-batcher: skuplja pojedinačne pozive nekoliko milisekundi
+# (ili do max_batch komada), izvrši ih jednim pozivom i svakom pozivatelju
+# vrati njegov rezultat.
+
+import asyncio
+
+
+class MicroBatcher:
+    def __init__(self, flush_fn, max_batch: int = 50, max_delay: float = 0.01, name: str = "batch",
+                 max_pending: int = None):
+        """
+        flush_fn: async fn(items) -> lista rezultata istim redoslijedom kao items.
+        Element liste može biti Exception - tada ga dobije samo taj pozivatelj.
+        max_pending: najviše stavki u bufferu + u letu; submit iznad toga čeka (backpressure).
+        """
+        self.flush_fn = flush_fn
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._slots = asyncio.Semaphore(max_pending) if max_pending else None
+
+    async def submit(self, item):
+        if self._slots is not None:
+            await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if self._slots is not None:
+            future.add_done_callback(lambda _: self._slots.release())
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await self.flush_fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """Pošalji sve što čeka i pričekaj batcheve u letu"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else None,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,120 @@
+"""
+Load test za /api/stripe/create-checkout-session prema lokalnim stubovima.
+
+Stripe API je lokalni stub server s umjetnom latencijom, a Supabase lookupovi
+(get_business / get_plan / update_business) su zamijenjeni blokirajućim
+time.sleep iste latencije. Mjeri throughput za rastuću konkurentnost - s
+vlastitim Stripe poolom (STRIPE_MAX_WORKERS) throughput raste i preko 40
+threadova FastAPI threadpoola.
+
+    python benchmarks/bench_checkout.py --stripe-ms 150 --db-ms 30 --concurrency 20 80 160
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench")
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_bench")
+os.environ["LOCAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_checkout.db")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_stripe_stub(port: int, delay_ms: float):
+    import uvicorn
+    from fastapi import FastAPI
+
+    stub = FastAPI()
+
+    @stub.post("/v1/checkout/sessions")
+    async def checkout_session():
+        await asyncio.sleep(delay_ms / 1000)
+        return {"id": "cs_test_bench", "object": "checkout.session", "url": "https://checkout.stripe.test/bench"}
+
+    @stub.post("/v1/customers")
+    async def customer():
+        await asyncio.sleep(delay_ms / 1000)
+        return {"id": "cus_bench", "object": "customer"}
+
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stripe-ms", type=float, default=150)
+    parser.add_argument("--db-ms", type=float, default=30)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[20, 80, 160])
+    args = parser.parse_args()
+
+    port = _free_port()
+    server = _start_stripe_stub(port, args.stripe_ms)
+
+    import httpx
+    import stripe
+    import main as app_main
+    import stripe_service
+
+    stripe.api_base = f"http://127.0.0.1:{port}"
+    db_delay = args.db_ms / 1000
+
+    def fake_get_business(business_id):
+        time.sleep(db_delay)
+        return {"id": business_id, "name": "Bench", "email": "bench@test", "stripe_customer_id": "cus_bench"}
+
+    def fake_get_plan(plan_id):
+        time.sleep(db_delay)
+        return {"id": plan_id, "stripe_price_id": "price_bench", "request_limit": 100}
+
+    def fake_update_business(business_id, data):
+        time.sleep(db_delay)
+
+    stripe_service.get_business = fake_get_business
+    stripe_service.get_plan = fake_get_plan
+    stripe_service.update_business = fake_update_business
+
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for concurrency in args.concurrency:
+            sem = asyncio.Semaphore(concurrency)
+            samples = []
+
+            async def one(i):
+                async with sem:
+                    start = time.perf_counter()
+                    resp = await client.post("/api/stripe/create-checkout-session",
+                                             json={"business_id": f"b{i}", "plan_id": "p1"})
+                    resp.raise_for_status()
+                    samples.append((time.perf_counter() - start) * 1000)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.requests)))
+            elapsed = time.perf_counter() - started
+            print(
+                f"concurrency={concurrency:<4} rps={len(samples) / elapsed:7.1f} "
+                f"p50={statistics.median(samples):.0f}ms p99={sorted(samples)[int(len(samples) * 0.99) - 1]:.0f}ms"
+            )
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
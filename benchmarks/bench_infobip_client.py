@@ -0,0 +1,144 @@
+"""
+Benchmark: novi httpx.AsyncClient po poruci vs. dijeljeni (pooled) Infobip klijent.
+
+Podiže lokalni stub Infobip server i mjeri p50/p99 latenciju slanja templatea.
+
+    python benchmarks/bench_infobip_client.py --requests 500 --concurrency 20
+
+Napomena: stub radi na čistom HTTP-u pa mjerenje pokazuje samo uštedu na TCP
+handshakeu; prema pravom Infobipu (TLS) razlika je još veća.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_stub(port: int, delay_ms: float):
+    import uvicorn
+    from fastapi import FastAPI
+
+    stub = FastAPI()
+
+    @stub.post("/whatsapp/1/message/template")
+    async def template(payload: dict):
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+        return {
+            "messages": [
+                {"to": m["to"], "messageId": f"stub-{i}", "status": {"groupName": "PENDING"}}
+                for i, m in enumerate(payload.get("messages", []))
+            ]
+        }
+
+    server = uvicorn.Server(uvicorn.Config(stub, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _run(send, total: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(i):
+        async with sem:
+            start = time.perf_counter()
+            await send(i)
+            samples.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def _report(label, samples, elapsed):
+    print(
+        f"{label:<10} n={len(samples)} "
+        f"p50={statistics.median(samples):.2f}ms "
+        f"p99={_percentile(samples, 99):.2f}ms "
+        f"rps={len(samples) / elapsed:.0f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="umjetna latencija stuba")
+    args = parser.parse_args()
+
+    port = _free_port()
+    os.environ["INFOBIP_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("INFOBIP_API_KEY", "bench")
+    os.environ.setdefault("INFOBIP_WHATSAPP_NUMBER", "+385000000000")
+    server = _start_stub(port, args.delay_ms)
+
+    import httpx
+    import whatsapp_service
+    from template_map import profession_to_template_type
+
+    profession = next(iter(profession_to_template_type))
+    payload = {
+        "messages": [{
+            "from": whatsapp_service.INFOBIP_SENDER,
+            "to": "+385911111111",
+            "content": {"templateName": "bench", "templateData": {"body": {"placeholders": []}}, "language": "hr"},
+        }]
+    }
+
+    # Stari način: novi klijent (TCP handshake) za svaku poruku
+    async def send_fresh(i):
+        async with httpx.AsyncClient() as client:
+            resp = await client.post(f"{whatsapp_service.INFOBIP_BASE_URL}/whatsapp/1/message/template", json=payload)
+            resp.raise_for_status()
+
+    # Novi način: dijeljeni klijent iz whatsapp_service
+    async def send_pooled(i):
+        await whatsapp_service.send_whatsapp_template(
+            to_number=f"+3859100{i:05d}", profession=profession, stage="pm_intro", placeholders=["Bench"]
+        )
+
+    # Utišaj printove iz send_whatsapp_template da ne mjerimo stdout
+    devnull = open(os.devnull, "w")
+    real_stdout, sys.stdout = sys.stdout, devnull
+    try:
+        await _run(send_fresh, 20, 5)
+        fresh = await _run(send_fresh, args.requests, args.concurrency)
+        await whatsapp_service.start_infobip_client()
+        await _run(send_pooled, 20, 5)
+        pooled = await _run(send_pooled, args.requests, args.concurrency)
+        await whatsapp_service.close_infobip_client()
+    finally:
+        sys.stdout = real_stdout
+        devnull.close()
+
+    _report("fresh", *fresh)
+    _report("pooled", *pooled)
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+"""
+Benchmark: cold start workera.
+
+1. `import main` u svježem interpreteru (N puta), opcionalno s -X importtime
+   listom najskupljih modula.
+2. Od pokretanja uvicorna do: prvog HTTP odgovora, /healthz 200 (klijenti
+   zagrijani) i prvog posluženog /missed-call requesta, prema lokalnim fake
+   Infobip / Supabase / Stripe serverima.
+
+    python benchmarks/bench_startup.py --runs 5 --top 15 --out startup_results.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from fakes import FakeDatabase, make_infobip, make_postgrest, make_stripe
+from run_suite import FAKE_SERVICE_KEY, PROFESSION, ROOT, _free_port, _serve
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def _summary(samples: list) -> dict:
+    return {
+        "min_ms": round(min(samples) * 1000, 1),
+        "p50_ms": round(statistics.median(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def measure_import(env: dict, runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def import_profile(env: dict, top: int) -> list:
+    """Najskuplji moduli po kumulativnom vremenu (-X importtime)"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append({"module": module.strip(), "self_ms": round(int(self_us) / 1000, 1),
+                     "cumulative_ms": round(int(cumulative_us) / 1000, 1)})
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def measure_boot(env: dict, business_id: str, timeout: float = 30) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    marks = {}
+    try:
+        deadline = started + timeout
+        while "ready" not in marks:
+            if time.perf_counter() > deadline:
+                raise RuntimeError("App nije postao ready u zadanom vremenu")
+            if proc.poll() is not None:
+                raise RuntimeError(f"App se srušio pri startu (exit {proc.returncode})")
+            try:
+                resp = httpx.get(f"{base_url}/healthz", timeout=1)
+            except httpx.HTTPError:
+                time.sleep(0.01)
+                continue
+            marks.setdefault("first_response", time.perf_counter() - started)
+            if resp.status_code == 200:
+                marks["ready"] = time.perf_counter() - started
+            else:
+                time.sleep(0.01)
+
+        resp = httpx.post(f"{base_url}/missed-call", timeout=10, json={
+            "phone_number": "+385910000001", "business_id": business_id, "profession": PROFESSION,
+        })
+        resp.raise_for_status()
+        marks["first_request"] = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait(timeout=15)
+    return marks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="koliko najskupljih importa ispisati (0 = bez profila)")
+    parser.add_argument("--out", help="JSON s rezultatima")
+    args = parser.parse_args()
+
+    db = FakeDatabase()
+    db.seed(5)
+    servers = [_serve(make_infobip()), _serve(make_postgrest(db)), _serve(make_stripe())]
+    (_, infobip_url), (_, postgrest_url), (_, stripe_url) = servers
+
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": postgrest_url,
+        "SUPABASE_SERVICE_ROLE_KEY": FAKE_SERVICE_KEY,
+        "INFOBIP_BASE_URL": infobip_url,
+        "INFOBIP_API_KEY": "bench",
+        "INFOBIP_WHATSAPP_NUMBER": "+385000000000",
+        "STRIPE_SECRET_KEY": "sk_test_bench",
+        "STRIPE_API_BASE": stripe_url,
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        "METRICS_ENABLED": "false",
+    })
+
+    try:
+        import_samples = measure_import(env, args.runs)
+        print(f"import main         {_summary(import_samples)}")
+
+        profile = import_profile(env, args.top) if args.top else []
+        for row in profile:
+            print(f"  {row['cumulative_ms']:>8} ms  {row['module']}")
+
+        boots = []
+        business_id = db.tables["businesses"][0]["id"]
+        for _ in range(args.runs):
+            # Svaki start sa svježom lokalnom bazom (outbox, dedupe)
+            env["LOCAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_local.db")
+            boots.append(measure_boot(env, business_id))
+
+        boot = {key: _summary([b[key] for b in boots]) for key in ("first_response", "ready", "first_request")}
+        for key, summary in boot.items():
+            print(f"{key:<19} {summary}")
+    finally:
+        for server, _ in servers:
+            server.should_exit = True
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"timestamp": time.time(), "config": vars(args), "import_main": _summary(import_samples),
+                       "import_profile": profile, "boot": boot}, f, indent=2)
+        print(f"Rezultati: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
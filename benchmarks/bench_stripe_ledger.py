@@ -0,0 +1,91 @@
+"""
+Koliko latencije dodaje Stripe event ledger (dedupe po event.id + out-of-order
+provjera po subscriptionu).
+
+Replaya snimljeni stream eventa (JSON lines, npr. export `stripe events list`)
+ili, bez --events, sintetički stream s ~10% redeliveryja i ~5% eventa izvan reda.
+
+    python benchmarks/bench_stripe_ledger.py --events captured_events.jsonl
+    python benchmarks/bench_stripe_ledger.py --synthetic 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ["LOCAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_ledger.db")
+
+
+def _synthetic(n: int) -> list:
+    types = ["customer.subscription.updated", "invoice.payment_succeeded", "customer.subscription.created"]
+    events = []
+    now = int(time.time())
+    for i in range(n):
+        sub = f"sub_{random.randint(1, n // 20 or 1)}"
+        events.append({
+            "id": f"evt_{i}",
+            "type": random.choice(types),
+            "created": now + i,
+            "data": {"object": {"id": sub, "customer": f"cus_{sub}"}},
+        })
+    # Redelivery (isti event.id) i eventi izvan reda
+    for _ in range(n // 10):
+        events.insert(random.randrange(len(events)), dict(random.choice(events)))
+    for _ in range(n // 20):
+        i = random.randrange(1, len(events))
+        events[i - 1], events[i] = events[i], events[i - 1]
+    return events
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", help="JSON lines datoteka sa snimljenim Stripe eventima")
+    parser.add_argument("--synthetic", type=int, default=20000)
+    args = parser.parse_args()
+
+    from dedupe import DedupeIndex, accept_version
+
+    if args.events:
+        with open(args.events) as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    else:
+        events = _synthetic(args.synthetic)
+
+    ledger = DedupeIndex("bench_stripe_event")
+    samples = []
+    outcome = {"applied": 0, "duplicate": 0, "stale": 0}
+
+    for event in events:
+        start = time.perf_counter()
+        if not await ledger.claim(event["id"]):
+            outcome["duplicate"] += 1
+        elif event["type"].startswith("customer.subscription.") and not await accept_version(
+            "bench_subscription", event["data"]["object"]["id"], event["created"]
+        ):
+            outcome["stale"] += 1
+        else:
+            outcome["applied"] += 1
+        samples.append((time.perf_counter() - start) * 1_000_000)
+
+    print(f"eventi: {len(events)} → {outcome}")
+    print(
+        f"ledger overhead: p50={statistics.median(samples):.0f}µs "
+        f"p99={_percentile(samples, 99):.0f}µs max={max(samples):.0f}µs"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Provjera da /missed-call ne blokira event loop dok čeka Supabase.
+
+Supabase pozive zamjenjuje sinkronim time.sleep (kao pravi blokirajući
+PostgREST round trip); poruke idu u privremeni outbox. N istovremenih
+webhookova mora završiti u otprilike vremenu jednog.
+
+    python benchmarks/bench_webhook_concurrency.py --n 10 --db-ms 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:1")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "bench")
+os.environ.setdefault("INFOBIP_BASE_URL", "http://127.0.0.1:1")
+os.environ["LOCAL_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "bench_outbox.db")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=10)
+    parser.add_argument("--db-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    import httpx
+    import main as app_main
+    import state_memory
+    import supabase_service
+
+    db_delay = args.db_ms / 1000
+
+    def slow_set_state(*a, **kw):
+        time.sleep(db_delay)
+
+    def slow_get_business(business_id):
+        time.sleep(db_delay)
+        return {"id": business_id, "name": "Bench obrt"}
+
+    def slow_usage(business_id):
+        time.sleep(db_delay)
+        return {"used_request": 0, "request_limit": None}
+
+    def slow_consume(business_id, amount=1):
+        time.sleep(db_delay)
+        return {"allowed": True, "used_request": amount, "request_limit": None}
+
+    state_memory.set_state = slow_set_state
+    supabase_service.get_business_by_id = slow_get_business
+    supabase_service.get_subscription_usage = slow_usage
+    supabase_service.consume_request_quota = slow_consume
+
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        def call(i):
+            return client.post("/missed-call", json={
+                "phone_number": f"+3859100{i:05d}",
+                "business_id": "bench-business",
+                "profession": "Vodoinstalater",
+            })
+
+        start = time.perf_counter()
+        await call(0)
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(call(i) for i in range(args.n)))
+        burst = time.perf_counter() - start
+
+    assert all(r.status_code == 200 for r in responses), [r.status_code for r in responses]
+    print(f"1 webhook:  {single * 1000:.0f}ms")
+    print(f"{args.n} webhooka: {burst * 1000:.0f}ms (omjer {burst / single:.2f}x)")
+    if burst > single * 2:
+        sys.exit("❌ Webhookovi se serijaliziraju - event loop je blokiran")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+"""
+Provjera cache backenda (cache.py): in-memory LRU i Redis-kompatibilan backend.
+
+Za Redis koristi --redis-url (lokalni redis / valkey / dragonfly) ili, bez njega,
+fakeredis ako je instaliran (pip install fakeredis). Izlazi s kodom 1 ako neka
+provjera padne.
+
+    python benchmarks/check_cache.py
+    python benchmarks/check_cache.py --redis-url redis://localhost:6379/15
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cache import Cache, MemoryCache, RedisCache
+
+TTL = 0.2
+
+
+def _check_common(name: str, cache: Cache) -> list:
+    failures = []
+
+    def expect(ok: bool, what: str):
+        print(f"  {'✅' if ok else '❌'} {what}")
+        if not ok:
+            failures.append(f"{name}: {what}")
+
+    cache.set("a", {"step": "intro"})
+    expect(cache.get("a") == {"step": "intro"}, "set → get vraća vrijednost")
+    expect(cache.get("missing") is None, "nepostojeći ključ → None")
+    expect((cache.hits, cache.misses) == (1, 1), "brojači hit/miss")
+
+    cache.set("a", {"step": "details"})
+    expect(cache.get("a") == {"step": "details"}, "write-through prepisuje vrijednost")
+
+    cache.delete("a")
+    expect(cache.get("a") is None, "delete invalidira ključ")
+
+    cache.set("ttl", 1, ttl=TTL)
+    time.sleep(TTL * 1.5)
+    expect(cache.get("ttl") is None, "ključ istječe nakon TTL-a")
+
+    expect(cache.set_if_absent("once", 1) is True, "set_if_absent na slobodan ključ")
+    expect(cache.set_if_absent("once", 2) is False, "set_if_absent na zauzet ključ")
+    expect(cache.get("once") == 1, "set_if_absent ne prepisuje postojeću vrijednost")
+    cache.set_if_absent("short", 1, ttl=TTL)
+    time.sleep(TTL * 1.5)
+    expect(cache.set_if_absent("short", 2) is True, "set_if_absent nakon isteka")
+
+    cache.set("x", 1)
+    cache.clear()
+    expect(cache.get("x") is None and cache.get("once") is None, "clear briše sve ključeve")
+    return failures
+
+
+def check_memory() -> list:
+    print("memory")
+    failures = _check_common("memory", Cache("check", MemoryCache(maxsize=100), ttl=60))
+
+    lru = MemoryCache(maxsize=2)
+    lru.set("a", 1, 60)
+    lru.set("b", 2, 60)
+    lru.get("a")
+    lru.set("c", 3, 60)
+    ok = lru.get("b") is None and lru.get("a") == 1 and lru.size() == 2 and lru.evictions == 1
+    print(f"  {'✅' if ok else '❌'} LRU izbacuje najdulje nekorišten ključ, size/evictions točni")
+    if not ok:
+        failures.append("memory: LRU eviction")
+    return failures
+
+
+def check_redis(url: str = None) -> list:
+    if url:
+        import redis
+        client = redis.Redis.from_url(url)
+    else:
+        try:
+            import fakeredis
+        except ImportError:
+            print("redis: preskočeno (nema --redis-url ni paketa fakeredis)")
+            return []
+        client = fakeredis.FakeRedis()
+
+    print(f"redis ({url or 'fakeredis'})")
+    backend = RedisCache(prefix=f"autoping:check:{uuid.uuid4().hex}:", client=client)
+    failures = _check_common("redis", Cache("check", backend, ttl=60))
+
+    # Dva "workera" s istim prefiksom vide iste ključeve
+    other = RedisCache(prefix=backend.prefix, client=client)
+    backend.set("shared", {"step": "details"}, 60)
+    ok = other.get("shared") == {"step": "details"} and other.set_if_absent("shared", 1, 60) is False
+    print(f"  {'✅' if ok else '❌'} drugi worker vidi isti ključ")
+    if not ok:
+        failures.append("redis: shared")
+    backend.clear()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", help="Redis-kompatibilan server (inače fakeredis)")
+    args = parser.parse_args()
+
+    failures = check_memory() + check_redis(args.redis_url)
+    if failures:
+        print("❌ Neuspjele provjere:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("✅ Sve provjere prošle")
+
+
+if __name__ == "__main__":
+    main()
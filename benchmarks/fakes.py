@@ -0,0 +1,412 @@
+"""
+Lokalni stand-ini za Infobip, Supabase (PostgREST) i Stripe s podesivom latencijom.
+
+Fake PostgREST podržava točno ono što app koristi preko supabase-py:
+select / insert / upsert / update / delete s eq, neq, lt, lte, gt, gte i is
+filterima, order, limit, .single() (Accept: application/vnd.pgrst.object+json)
+i RPC funkcije iz sql/ direktorija.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, Request, Response
+
+
+def _sleep(ms: float):
+    return asyncio.sleep(ms / 1000) if ms else asyncio.sleep(0)
+
+
+# ========================
+# Infobip
+# ========================
+
+def make_infobip(latency_ms: float = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.messages = 0
+    ids = itertools.count()
+
+    @app.post("/whatsapp/1/message/template")
+    async def template(payload: dict):
+        await _sleep(latency_ms)
+        app.state.requests += 1
+        app.state.messages += len(payload.get("messages", []))
+        return {
+            "bulkId": f"bulk-{next(ids)}",
+            "messages": [
+                {"to": m["to"], "messageCount": 1, "messageId": f"msg-{next(ids)}",
+                 "status": {"groupId": 1, "groupName": "PENDING", "id": 7, "name": "PENDING_ENROUTE"}}
+                for m in payload.get("messages", [])
+            ],
+        }
+
+    return app
+
+
+# ========================
+# Supabase / PostgREST
+# ========================
+
+def _coerce(value: str):
+    if value == "null":
+        return None
+    if value in ("true", "false"):
+        return value == "true"
+    return value
+
+
+def _matches(row: dict, filters: list) -> bool:
+    for column, op, raw in filters:
+        actual = row.get(column)
+        expected = _coerce(raw)
+        if op == "is":
+            if actual is not expected:
+                return False
+            continue
+        if op in ("eq", "neq"):
+            same = str(actual) == str(expected) if actual is not None else expected is None
+            if same != (op == "eq"):
+                return False
+            continue
+        if actual is None:
+            return False
+        a, b = (float(actual), float(expected)) if isinstance(actual, (int, float)) else (str(actual), str(expected))
+        if not {"lt": a < b, "lte": a <= b, "gt": a > b, "gte": a >= b}[op]:
+            return False
+    return True
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.tables = {
+            "businesses": [],
+            "subscription_plans": [],
+            "subscriptions": [],
+            "user_states": [],
+            "requests": [],
+        }
+        self.lock = threading.Lock()
+        self.rpcs = {
+            "consume_request_quota": self.consume_request_quota,
+            "refund_request_quota": self.refund_request_quota,
+            "get_subscription_overview": self.get_subscription_overview,
+            "stripe_checkout_completed": self.stripe_checkout_completed,
+            "stripe_subscription_changed": self.stripe_subscription_changed,
+            "stripe_invoice_paid": self.stripe_invoice_paid,
+            "stripe_invoice_failed": self.stripe_invoice_failed,
+            "acquire_job_lease": self.acquire_job_lease,
+            "sweep_subscription_renewals": self.sweep_subscription_renewals,
+            "purge_expired_user_states": self.purge_expired_user_states,
+            "user_state_counts": self.user_state_counts,
+        }
+        self.leases = {}
+
+    def seed(self, businesses: int = 50, request_limit: int = 1_000_000):
+        plan = {"id": str(uuid.uuid4()), "name": "Bench", "price": 10, "request_limit": request_limit,
+                "stripe_price_id": "price_bench"}
+        self.tables["subscription_plans"].append(plan)
+        renewal = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
+        for i in range(businesses):
+            business_id = str(uuid.uuid4())
+            self.tables["businesses"].append({
+                "id": business_id, "name": f"Obrt {i}", "email": f"obrt{i}@bench.test",
+                "stripe_customer_id": f"cus_bench_{i}", "stripe_subscription_id": f"sub_bench_{i}",
+                "subscription_plan_id": plan["id"], "subscription_status": "active",
+            })
+            self.tables["subscriptions"].append({
+                "id": str(uuid.uuid4()), "business_id": business_id, "used_request": 0,
+                "request_limit": request_limit, "renewal_date": renewal,
+            })
+        return plan
+
+    # --- RPC ---
+
+    def consume_request_quota(self, p_business_id, p_amount=1):
+        for sub in self.tables["subscriptions"]:
+            if sub["business_id"] == p_business_id:
+                limit = sub.get("request_limit")
+                if not limit or limit <= 0 or sub["used_request"] + p_amount <= limit:
+                    sub["used_request"] += p_amount
+                    return [{"allowed": True, "used_request": sub["used_request"], "request_limit": limit}]
+                return [{"allowed": False, "used_request": sub["used_request"], "request_limit": limit}]
+        return [{"allowed": True, "used_request": 0, "request_limit": None}]
+
+    def refund_request_quota(self, p_business_id, p_amount=1):
+        for sub in self.tables["subscriptions"]:
+            if sub["business_id"] == p_business_id:
+                sub["used_request"] = max(sub["used_request"] - p_amount, 0)
+                return [{"used_request": sub["used_request"], "request_limit": sub.get("request_limit")}]
+        return []
+
+    def get_subscription_overview(self, p_business_id):
+        business = next((b for b in self.tables["businesses"] if b["id"] == p_business_id), None)
+        if not business:
+            return None
+        sub = next((s for s in self.tables["subscriptions"] if s["business_id"] == p_business_id), {})
+        plan = next((p for p in self.tables["subscription_plans"] if p["id"] == business.get("subscription_plan_id")), None)
+        return {
+            "business_id": business["id"],
+            "subscription_status": business.get("subscription_status"),
+            "stripe_status": business.get("stripe_status"),
+            "stripe_current_period_end": business.get("stripe_current_period_end"),
+            "stripe_cancel_at_period_end": business.get("stripe_cancel_at_period_end"),
+            "trial_ends_at": business.get("trial_ends_at"),
+            "used_request": sub.get("used_request"),
+            "request_limit": sub.get("request_limit"),
+            "renewal_date": sub.get("renewal_date"),
+            "plan": plan and {k: plan[k] for k in ("id", "name", "price", "request_limit")},
+        }
+
+    # --- Stripe webhook RPC (sql/004_stripe_event_functions.sql) ---
+
+    def _plan_limit(self, plan_id) -> int:
+        plan = next((p for p in self.tables["subscription_plans"] if p["id"] == plan_id), None)
+        return (plan or {}).get("request_limit") or 0
+
+    def _reset_usage(self, business_id, request_limit):
+        renewal = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
+        sub = next((s for s in self.tables["subscriptions"] if s["business_id"] == business_id), None)
+        if sub is None:
+            sub = {"id": str(uuid.uuid4()), "business_id": business_id}
+            self.tables["subscriptions"].append(sub)
+        sub.update({"used_request": 0, "request_limit": request_limit, "renewal_date": renewal})
+
+    def _update_by_customer(self, customer_id, data: dict) -> list:
+        updated = []
+        for business in self.tables["businesses"]:
+            if business.get("stripe_customer_id") == customer_id:
+                business.update(data)
+                updated.append(business)
+        return updated
+
+    def stripe_checkout_completed(self, p_business_id, p_plan_id, p_subscription_id=None):
+        business = next((b for b in self.tables["businesses"] if b["id"] == p_business_id), None)
+        if not business:
+            return []
+        business.update({"subscription_status": "active", "subscription_plan_id": p_plan_id})
+        if p_subscription_id:
+            business["stripe_subscription_id"] = p_subscription_id
+        self._reset_usage(p_business_id, self._plan_limit(p_plan_id))
+        return [{"business_id": p_business_id, "customer_id": business.get("stripe_customer_id"), "usage_reset": True}]
+
+    def stripe_subscription_changed(self, p_customer_id, p_subscription_id, p_status,
+                                    p_current_period_end=None, p_cancel_at_period_end=None):
+        updated = self._update_by_customer(p_customer_id, {
+            "subscription_status": p_status, "stripe_subscription_id": p_subscription_id,
+            "stripe_status": p_status, "stripe_current_period_end": p_current_period_end,
+            "stripe_cancel_at_period_end": p_cancel_at_period_end,
+        })
+        return [{"business_id": b["id"], "customer_id": p_customer_id, "usage_reset": False} for b in updated]
+
+    def _renewal_due(self, business_id) -> bool:
+        # sql/007_invoice_reset_guard.sql: sweeper je ciklus možda već resetirao
+        sub = next((s for s in self.tables["subscriptions"] if s["business_id"] == business_id), None)
+        if not sub or not sub.get("renewal_date"):
+            return True
+        grace = datetime.now(timezone.utc) + timedelta(days=2)
+        return datetime.fromisoformat(sub["renewal_date"]) <= grace
+
+    def stripe_invoice_paid(self, p_customer_id, p_reset_usage=False):
+        rows = []
+        for business in self._update_by_customer(p_customer_id, {"subscription_status": "active"}):
+            reset = bool(p_reset_usage and business.get("subscription_plan_id") and self._renewal_due(business["id"]))
+            if reset:
+                self._reset_usage(business["id"], self._plan_limit(business["subscription_plan_id"]))
+            rows.append({"business_id": business["id"], "customer_id": p_customer_id, "usage_reset": reset})
+        return rows
+
+    def stripe_invoice_failed(self, p_customer_id):
+        updated = self._update_by_customer(p_customer_id, {"subscription_status": "past_due"})
+        return [{"business_id": b["id"], "customer_id": p_customer_id, "usage_reset": False} for b in updated]
+
+    # --- Background jobovi (sql/005_renewal_sweeper.sql) ---
+
+    def acquire_job_lease(self, p_name, p_holder, p_ttl_seconds):
+        holder, expires_at = self.leases.get(p_name, (None, 0))
+        if holder not in (None, p_holder) and expires_at > time.time():
+            return False
+        self.leases[p_name] = (p_holder, time.time() + p_ttl_seconds)
+        return True
+
+    def sweep_subscription_renewals(self):
+        now = datetime.now(timezone.utc)
+        active = {b["id"] for b in self.tables["businesses"] if b.get("subscription_status") in ("active", "trialing")}
+        reset = []
+        for sub in self.tables["subscriptions"]:
+            renewal = sub.get("renewal_date")
+            if sub["business_id"] not in active or not renewal:
+                continue
+            renewal = datetime.fromisoformat(renewal)
+            if renewal > now:
+                continue
+            cycles = int((now - renewal).total_seconds() // (30 * 86400)) + 1
+            sub.update({"used_request": 0, "renewal_date": (renewal + timedelta(days=30 * cycles)).isoformat()})
+            reset.append({"business_id": sub["business_id"]})
+        return reset
+
+    # --- user_states expiry (sql/006_user_states_expiry.sql) ---
+
+    @staticmethod
+    def _expired(row, now) -> bool:
+        expires_at = row.get("expires_at")
+        return bool(expires_at) and datetime.fromisoformat(expires_at) <= now
+
+    def purge_expired_user_states(self, p_batch=1000):
+        now = datetime.now(timezone.utc)
+        rows = self.tables["user_states"]
+        expired = [r for r in rows if self._expired(r, now)][:p_batch]
+        for row in expired:
+            rows.remove(row)
+        return len(expired)
+
+    def user_state_counts(self):
+        now = datetime.now(timezone.utc)
+        expired = sum(1 for r in self.tables["user_states"] if self._expired(r, now))
+        return [{"live": len(self.tables["user_states"]) - expired, "expired": expired}]
+
+
+def make_postgrest(db: FakeDatabase, latency_ms: float = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+
+    def parse(request: Request):
+        filters, limit, order = [], None, None
+        for key, value in request.query_params.multi_items():
+            if key in ("select", "on_conflict", "columns"):
+                continue
+            if key == "limit":
+                limit = int(value)
+            elif key == "order":
+                order = value
+            elif "." in value:
+                op, raw = value.split(".", 1)
+                filters.append((key, op, raw))
+        return filters, limit, order
+
+    def respond(request: Request, rows: list, status: int = 200):
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return Response(json.dumps({"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned"}),
+                                status_code=406, media_type="application/json")
+            return Response(json.dumps(rows[0], default=str), status_code=status, media_type="application/json")
+        return Response(json.dumps(rows, default=str), status_code=status, media_type="application/json")
+
+    @app.post("/rest/v1/rpc/{fn}")
+    async def rpc(fn: str, request: Request):
+        await _sleep(latency_ms)
+        app.state.calls += 1
+        params = await request.json() if await request.body() else {}
+        with db.lock:
+            result = db.rpcs[fn](**params)
+        return Response(json.dumps(result, default=str), media_type="application/json")
+
+    @app.get("/rest/v1/{table}")
+    async def select(table: str, request: Request):
+        await _sleep(latency_ms)
+        app.state.calls += 1
+        filters, limit, order = parse(request)
+        with db.lock:
+            rows = [dict(r) for r in db.tables.setdefault(table, []) if _matches(r, filters)]
+        if order:
+            column, _, direction = order.partition(".")
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith("desc"))
+        return respond(request, rows[:limit] if limit else rows)
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        await _sleep(latency_ms)
+        app.state.calls += 1
+        body = await request.json()
+        rows = body if isinstance(body, list) else [body]
+        upsert = "merge-duplicates" in request.headers.get("prefer", "")
+        conflict = request.query_params.get("on_conflict", "id")
+        created = []
+        with db.lock:
+            table_rows = db.tables.setdefault(table, [])
+            for row in rows:
+                row = dict(row)
+                row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+                existing = next((r for r in table_rows if upsert and r.get(conflict) == row.get(conflict)), None)
+                if existing is not None:
+                    existing.update({k: v for k, v in row.items() if k != "id"})
+                    created.append(dict(existing))
+                else:
+                    table_rows.append(row)
+                    created.append(dict(row))
+        return respond(request, created, status=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update(table: str, request: Request):
+        await _sleep(latency_ms)
+        app.state.calls += 1
+        filters, _, _ = parse(request)
+        data = await request.json()
+        with db.lock:
+            updated = []
+            for row in db.tables.setdefault(table, []):
+                if _matches(row, filters):
+                    row.update(data)
+                    updated.append(dict(row))
+        return respond(request, updated)
+
+    @app.delete("/rest/v1/{table}")
+    async def delete(table: str, request: Request):
+        await _sleep(latency_ms)
+        app.state.calls += 1
+        filters, _, _ = parse(request)
+        with db.lock:
+            rows = db.tables.setdefault(table, [])
+            deleted = [dict(r) for r in rows if _matches(r, filters)]
+            rows[:] = [r for r in rows if not _matches(r, filters)]
+        return respond(request, deleted)
+
+    return app
+
+
+# ========================
+# Stripe
+# ========================
+
+def make_stripe(latency_ms: float = 0) -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+
+    def subscription(sub_id: str) -> dict:
+        return {
+            "id": sub_id, "object": "subscription", "status": "active",
+            "current_period_end": int(time.time()) + 30 * 86400, "cancel_at_period_end": False,
+            "items": {"object": "list", "data": [{"id": f"si_{sub_id}", "object": "subscription_item"}]},
+        }
+
+    @app.post("/v1/customers")
+    async def customers():
+        await _sleep(latency_ms)
+        app.state.calls += 1
+        return {"id": f"cus_{uuid.uuid4().hex[:14]}", "object": "customer"}
+
+    @app.post("/v1/checkout/sessions")
+    async def checkout_sessions():
+        await _sleep(latency_ms)
+        app.state.calls += 1
+        session_id = f"cs_test_{uuid.uuid4().hex[:14]}"
+        return {"id": session_id, "object": "checkout.session", "url": f"https://checkout.stripe.test/{session_id}"}
+
+    @app.get("/v1/subscriptions/{sub_id}")
+    async def get_subscription(sub_id: str):
+        await _sleep(latency_ms)
+        app.state.calls += 1
+        return subscription(sub_id)
+
+    @app.post("/v1/subscriptions/{sub_id}")
+    async def modify_subscription(sub_id: str):
+        await _sleep(latency_ms)
+        app.state.calls += 1
+        return subscription(sub_id)
+
+    return app
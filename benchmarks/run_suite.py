@@ -0,0 +1,297 @@
+"""
+Benchmark suite: pokreće `main:app` (uvicorn subprocess) prema lokalnim fake
+Infobip / Supabase (PostgREST) / Stripe serverima s umjetnom latencijom i
+tjera realističan promet:
+
+  missed_call_burst → button_clicks → details_texts → stripe_replay → overview → checkout
+
+Za svaki scenarij mjeri throughput i p50/p95/p99 latenciju po endpointu i
+zapisuje rezultate kao JSON. S --baseline uspoređuje s prethodnim rezultatom i
+izlazi s kodom 1 ako je neki scenarij sporiji od dopuštene tolerancije.
+
+    python benchmarks/run_suite.py --db-ms 20 --infobip-ms 80 --stripe-ms 150 --out bench_results.json
+    python benchmarks/run_suite.py --baseline bench_results.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+import uvicorn
+
+from fakes import FakeDatabase, make_infobip, make_postgrest, make_stripe
+
+WEBHOOK_SECRET = "whsec_bench"
+# supabase-py provjerava da ključ izgleda kao JWT
+FAKE_SERVICE_KEY = "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.bench"
+PROFESSION = "Frizerka / Barber"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(app) -> tuple:
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _sign(payload: bytes) -> str:
+    timestamp = int(time.time())
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(WEBHOOK_SECRET.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+async def _drive(client: httpx.AsyncClient, name: str, endpoint: str, requests: list, concurrency: int) -> dict:
+    """requests: lista (method, path, kwargs)"""
+    sem = asyncio.Semaphore(concurrency)
+    samples, errors = [], 0
+
+    async def one(method, path, kwargs):
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            try:
+                resp = await client.request(method, path, **kwargs)
+                if resp.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            samples.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(*r) for r in requests))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "scenario": name,
+        "endpoint": endpoint,
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "p50_ms": round(_percentile(samples, 50), 2),
+        "p95_ms": round(_percentile(samples, 95), 2),
+        "p99_ms": round(_percentile(samples, 99), 2),
+    }
+    print(
+        f"{name:<18} {endpoint:<40} n={result['requests']:<5} err={errors:<3} "
+        f"rps={result['throughput_rps']:<8} p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms"
+    )
+    return result
+
+
+def _webhook_batches(phones: list, batch_size: int, message) -> list:
+    requests = []
+    for i in range(0, len(phones), batch_size):
+        results = [
+            {"from": phone.lstrip("+"), "messageId": str(uuid.uuid4()), "message": message}
+            for phone in phones[i:i + batch_size]
+        ]
+        requests.append(("POST", "/infobip-webhook", {"json": {"results": results}}))
+    return requests
+
+
+def _stripe_events(db: FakeDatabase, n: int, duplicate_ratio: float) -> list:
+    businesses = db.tables["businesses"]
+    events = []
+    for i in range(n):
+        business = random.choice(businesses)
+        if i % 2:
+            obj = {"id": business["stripe_subscription_id"], "object": "subscription",
+                   "customer": business["stripe_customer_id"], "status": "active",
+                   "current_period_end": int(time.time()) + 30 * 86400, "cancel_at_period_end": False}
+            event_type = "customer.subscription.updated"
+        else:
+            obj = {"id": f"in_{i}", "object": "invoice", "customer": business["stripe_customer_id"],
+                   "subscription": business["stripe_subscription_id"], "billing_reason": "subscription_cycle"}
+            event_type = "invoice.payment_succeeded"
+        events.append({"id": f"evt_bench_{uuid.uuid4().hex}", "object": "event", "type": event_type,
+                       "created": int(time.time()) + i, "data": {"object": obj}})
+    # Redelivery istih eventa
+    events += random.sample(events, int(n * duplicate_ratio))
+    random.shuffle(events)
+
+    requests = []
+    for event in events:
+        payload = json.dumps(event).encode()
+        requests.append(("POST", "/api/stripe/webhook", {
+            "content": payload,
+            "headers": {"stripe-signature": _sign(payload), "content-type": "application/json"},
+        }))
+    return requests
+
+
+def _start_app(env: dict) -> tuple:
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"❌ App se srušio pri startu (exit {proc.returncode})")
+        try:
+            # /healthz je 200 tek kad su klijenti zagrijani i outbox radi
+            if httpx.get(f"{base_url}/healthz", timeout=1).status_code == 200:
+                return proc, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.kill()
+    sys.exit("❌ App se nije digao u 30s")
+
+
+def _compare(results: list, baseline_path: str, tolerance: float) -> list:
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["endpoint"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        base = baseline.get((r["scenario"], r["endpoint"]))
+        if not base:
+            continue
+        if r["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{r['scenario']}: p99 {base['p99_ms']}ms → {r['p99_ms']}ms")
+        if r["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{r['scenario']}: rps {base['throughput_rps']} → {r['throughput_rps']}")
+        if r["errors"] > base["errors"]:
+            regressions.append(f"{r['scenario']}: errors {base['errors']} → {r['errors']}")
+    return regressions
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db-ms", type=float, default=20, help="latencija fake PostgRESTa")
+    parser.add_argument("--infobip-ms", type=float, default=80)
+    parser.add_argument("--stripe-ms", type=float, default=150)
+    parser.add_argument("--calls", type=int, default=300, help="broj missed callova (i konverzacija)")
+    parser.add_argument("--stripe-events", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=1, help="rezultata po Infobip webhooku")
+    parser.add_argument("--businesses", type=int, default=50)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="prethodni --out za usporedbu")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    db = FakeDatabase()
+    db.seed(args.businesses)
+    infobip = make_infobip(args.infobip_ms)
+    postgrest = make_postgrest(db, args.db_ms)
+    stripe_app = make_stripe(args.stripe_ms)
+    servers = [_serve(infobip), _serve(postgrest), _serve(stripe_app)]
+    (_, infobip_url), (_, postgrest_url), (_, stripe_url) = servers
+
+    env = dict(os.environ)
+    env.update({
+        "SUPABASE_URL": postgrest_url,
+        "SUPABASE_SERVICE_ROLE_KEY": FAKE_SERVICE_KEY,
+        "INFOBIP_BASE_URL": infobip_url,
+        "INFOBIP_API_KEY": "bench",
+        "INFOBIP_WHATSAPP_NUMBER": "+385000000000",
+        "STRIPE_SECRET_KEY": "sk_test_bench",
+        "STRIPE_API_BASE": stripe_url,
+        "STRIPE_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "LOCAL_DB_PATH": os.path.join(tempfile.mkdtemp(), "bench_local.db"),
+        "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+    })
+    proc, base_url = _start_app(env)
+
+    phones = [f"+38591{i:07d}" for i in range(args.calls)]
+    businesses = db.tables["businesses"]
+    results = []
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            results.append(await _drive(client, "missed_call_burst", "POST /missed-call", [
+                ("POST", "/missed-call", {"json": {
+                    "phone_number": phone, "business_id": random.choice(businesses)["id"], "profession": PROFESSION,
+                }}) for phone in phones
+            ], args.concurrency))
+
+            results.append(await _drive(client, "button_clicks", "POST /infobip-webhook",
+                                        _webhook_batches(phones, args.batch_size, {"payload": "Opcija 1"}),
+                                        args.concurrency))
+
+            results.append(await _drive(client, "details_texts", "POST /infobip-webhook",
+                                        _webhook_batches(phones, args.batch_size, {"text": "Trebam termin sutra u 10h"}),
+                                        args.concurrency))
+
+            results.append(await _drive(client, "stripe_replay", "POST /api/stripe/webhook",
+                                        _stripe_events(db, args.stripe_events, 0.1), args.concurrency))
+
+            results.append(await _drive(client, "overview", "GET /api/stripe/overview/{id}", [
+                ("GET", f"/api/stripe/overview/{random.choice(businesses)['id']}", {}) for _ in range(args.calls)
+            ], args.concurrency))
+
+            plan_id = db.tables["subscription_plans"][0]["id"]
+            results.append(await _drive(client, "checkout", "POST /api/stripe/create-checkout-session", [
+                ("POST", "/api/stripe/create-checkout-session", {"json": {
+                    "business_id": random.choice(businesses)["id"], "plan_id": plan_id,
+                }}) for _ in range(args.calls // 2)
+            ], args.concurrency))
+
+        # Pričekaj da outbox isprazni red prema fake Infobipu
+        expected = args.calls * 3
+        deadline = time.time() + 30
+        while infobip.state.messages < expected and time.time() < deadline:
+            await asyncio.sleep(0.2)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=15)
+        for server, _ in servers:
+            server.should_exit = True
+
+    report = {
+        "timestamp": time.time(),
+        "config": vars(args),
+        "results": results,
+        "backends": {
+            "infobip_requests": infobip.state.requests,
+            "infobip_messages": infobip.state.messages,
+            "postgrest_calls": postgrest.state.calls,
+            "stripe_calls": stripe_app.state.calls,
+            "requests_rows": len(db.tables["requests"]),
+        },
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nBackend pozivi: {report['backends']}")
+    print(f"Rezultati: {args.out}")
+
+    if args.baseline:
+        regressions = _compare(results, args.baseline, args.max_regression)
+        if regressions:
+            print("❌ Regresije:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("✅ Nema regresija u odnosu na baseline")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
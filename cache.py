@@ -0,0 +1,248 @@
+# cache.py
+#
+# Mali write-through cache s TTL-om. Backend je zamjenjiv: in-memory LRU za
+# jedan worker, ili Redis (odnosno bilo koji Redis-kompatibilan server) kad
+# više workera mora dijeliti isti cache.
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import register_gauges
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# ========================
+# Backendi
+# ========================
+
+class CacheBackend:
+    """Sučelje koje backend mora implementirati"""
+
+    # True = isti podaci vidljivi svim workerima (smije se koristiti za odluke koje preskaču bazu)
+    shared = False
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl: float):
+        raise NotImplementedError
+
+    def set_if_absent(self, key, value, ttl: float) -> bool:
+        """Atomarno postavi ključ samo ako ne postoji (ili je istekao); True ako je postavljen"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def size(self):
+        """Broj ključeva ili None ako ga backend ne zna jeftino izračunati"""
+        return None
+
+
+class MemoryCache(CacheBackend):
+    """Ograničen LRU s TTL-om po ključu (thread-safe, DB pozivi idu iz thread poola)"""
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def set_if_absent(self, key, value, ttl: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                return False
+            self._data[key] = (now + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def size(self):
+        return len(self._data)
+
+
+class RedisCache(CacheBackend):
+    """Dijeljeni backend za više workera (vrijednosti se spremaju kao JSON)
+
+    Veličinu ne prijavljuje: brojanje ključeva po prefiksu je SCAN cijele baze.
+    """
+
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "autoping:", client=None):
+        """client: gotov Redis-kompatibilan klijent (npr. fakeredis u provjerama); inače se spaja na url"""
+        self.prefix = prefix
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("CACHE_BACKEND=redis traži paket 'redis' (pip install redis)") from e
+            client = redis.Redis.from_url(url)
+        self._redis = client
+
+    def get(self, key):
+        raw = self._redis.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl: float):
+        self._redis.set(self.prefix + key, json.dumps(value, default=str), px=int(ttl * 1000))
+
+    def set_if_absent(self, key, value, ttl: float) -> bool:
+        return bool(self._redis.set(self.prefix + key, json.dumps(value, default=str), px=int(ttl * 1000), nx=True))
+
+    def delete(self, key):
+        self._redis.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._redis.scan_iter(f"{self.prefix}*"):
+            self._redis.delete(key)
+
+# ========================
+# Cache s brojačima
+# ========================
+
+class Cache:
+    def __init__(self, name: str, backend: CacheBackend, ttl: float):
+        self.name = name
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        if value is None:
+            return
+        self.backend.set(key, value, ttl or self.ttl)
+
+    def set_if_absent(self, key, value, ttl: float = None) -> bool:
+        return self.backend.set_if_absent(key, value, ttl or self.ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else None,
+            "size": self.backend.size(),
+            "evictions": getattr(self.backend, "evictions", None),
+        }
+
+
+_caches = []
+
+
+def make_cache(name: str, ttl: float, maxsize: int = 10_000, backend: str = None) -> Cache:
+    backend = backend or CACHE_BACKEND
+    if backend == "redis":
+        cache = Cache(name, RedisCache(prefix=f"autoping:{name}:"), ttl)
+    elif backend == "memory":
+        cache = Cache(name, MemoryCache(maxsize), ttl)
+    else:
+        raise ValueError(f"Nepoznat CACHE_BACKEND: {backend}")
+    _caches.append(cache)
+    return cache
+
+
+def _cache_gauges() -> dict:
+    values = {}
+    for cache in _caches:
+        values[(cache.name, "hits")] = cache.hits
+        values[(cache.name, "misses")] = cache.misses
+        size = cache.backend.size()
+        if size is not None:
+            values[(cache.name, "size")] = size
+    return values
+
+
+register_gauges("autoping_cache", "Cache hitovi, missovi i veličina", _cache_gauges, ("cache", "stat"))
+
+# ========================
+# Business / plan cache
+# ========================
+
+# Planovi se mijenjaju jednom u kvartalu. Business row se cachira samo za lookup
+# imena na /missed-call; Stripe putanje (checkout, upgrade) uvijek čitaju iz baze.
+business_cache = make_cache("businesses", ttl=float(os.getenv("BUSINESS_CACHE_TTL", "60")), maxsize=5_000)
+plan_cache = make_cache("subscription_plans", ttl=float(os.getenv("PLAN_CACHE_TTL", "21600")), maxsize=500)
+
+
+def cache_business(business: dict):
+    """Spremi business row pod id i pod stripe_customer_id"""
+    if not business:
+        return
+    business_cache.set(f"id:{business['id']}", business)
+    if business.get("stripe_customer_id"):
+        business_cache.set(f"customer:{business['stripe_customer_id']}", business)
+
+
+def get_cached_business(business_id: str):
+    return business_cache.get(f"id:{business_id}")
+
+
+def invalidate_business(business_id: str = None, customer_id: str = None):
+    """Makni business iz cachea (oba ključa) nakon svakog update-a businesses tablice"""
+    if business_id:
+        cached = business_cache.backend.get(f"id:{business_id}")
+        if cached and cached.get("stripe_customer_id"):
+            business_cache.delete(f"customer:{cached['stripe_customer_id']}")
+        business_cache.delete(f"id:{business_id}")
+    if customer_id:
+        cached = business_cache.backend.get(f"customer:{customer_id}")
+        if cached:
+            business_cache.delete(f"id:{cached['id']}")
+        business_cache.delete(f"customer:{customer_id}")
@@ -0,0 +1,50 @@
+# coalesce.py
+#
+# Spajanje ponovljenih missed callova: isti broj prema istom businessu unutar
+# MISSED_CALL_COALESCE_SECONDS koristi već započeti intro razgovor, bez
+# set_state / get_business_by_id i bez nove (plaćene) intro poruke.
+#
+# Index je in-memory LRU (po workeru); s CACHE_BACKEND=redis prozor dijele svi workeri.
+
+import os
+
+from async_db import run_db
+from cache import MemoryCache, make_cache
+from metrics import COALESCE_SAVED_TOTAL
+
+MISSED_CALL_COALESCE_SECONDS = float(os.getenv("MISSED_CALL_COALESCE_SECONDS", "60"))
+MISSED_CALL_COALESCE_MAXSIZE = int(os.getenv("MISSED_CALL_COALESCE_MAXSIZE", "50000"))
+
+# Spojeni call preskače: set_state + get_business_by_id (DB) i pm_intro (Infobip)
+SAVED_DB_ROUND_TRIPS = 2
+SAVED_SENDS = 1
+
+_window = make_cache("missed_calls", ttl=MISSED_CALL_COALESCE_SECONDS, maxsize=MISSED_CALL_COALESCE_MAXSIZE)
+
+
+def _key(phone: str, business_id: str) -> str:
+    return f"{phone}:{business_id}"
+
+
+async def _call(fn, *args):
+    # Redis poziv ne smije blokirati event loop; in-memory je dovoljno brz za izravan poziv
+    if isinstance(_window.backend, MemoryCache):
+        return fn(*args)
+    return await run_db(fn, *args)
+
+
+async def claim_missed_call(phone: str, business_id: str) -> bool:
+    """True ako ovaj call otvara novi prozor; False ako ga treba spojiti s prethodnim"""
+    if MISSED_CALL_COALESCE_SECONDS <= 0:
+        return True
+    claimed = await _call(_window.set_if_absent, _key(phone, business_id), 1)
+    if not claimed:
+        COALESCE_SAVED_TOTAL.inc(SAVED_SENDS, kind="infobip_send")
+        COALESCE_SAVED_TOTAL.inc(SAVED_DB_ROUND_TRIPS, kind="db_round_trip")
+    return claimed
+
+
+async def release_missed_call(phone: str, business_id: str):
+    """Intro nije poslan (limit, greška) → idući call pokušava ispočetka"""
+    if MISSED_CALL_COALESCE_SECONDS > 0:
+        await _call(_window.delete, _key(phone, business_id))
@@ -0,0 +1,139 @@
+# dedupe.py
+#
+# Idempotentnost webhookova: in-memory prozor zadnjih ključeva (O(1) odbijanje
+# retryja) + trajna tablica u lokalnoj SQLite bazi da dedupe preživi restart.
+
+import os
+import time
+from collections import OrderedDict
+
+from local_store import register_schema, run_local
+from metrics import register_gauges
+
+DEDUPE_WINDOW = int(os.getenv("DEDUPE_WINDOW", "50000"))
+DEDUPE_RETENTION_HOURS = float(os.getenv("DEDUPE_RETENTION_HOURS", "72"))
+
+register_schema("""
+create table if not exists seen_keys (
+    namespace text not null,
+    key text not null,
+    seen_at real not null,
+    primary key (namespace, key)
+);
+create index if not exists seen_keys_seen_at on seen_keys (seen_at);
+
+create table if not exists object_versions (
+    namespace text not null,
+    object_id text not null,
+    created real not null,
+    primary key (namespace, object_id)
+);
+""")
+
+
+def _insert_key(conn, namespace: str, key: str) -> bool:
+    cur = conn.execute(
+        "insert or ignore into seen_keys (namespace, key, seen_at) values (?, ?, ?)",
+        (namespace, key, time.time()),
+    )
+    return cur.rowcount == 1
+
+
+def _insert_key_with(conn, namespace: str, key: str, on_first) -> bool:
+    """Ključ i on_first(conn) u istoj transakciji: ili su upisani oboje ili ništa"""
+    conn.execute("begin immediate")
+    try:
+        first = _insert_key(conn, namespace, key)
+        if first:
+            on_first(conn)
+        conn.execute("commit")
+    except Exception:
+        conn.execute("rollback")
+        raise
+    return first
+
+
+def _delete_key(conn, namespace: str, key: str):
+    conn.execute("delete from seen_keys where namespace = ? and key = ?", (namespace, key))
+
+
+def _accept_version(conn, namespace: str, object_id: str, created: float) -> bool:
+    cur = conn.execute(
+        "insert into object_versions (namespace, object_id, created) values (?, ?, ?) "
+        "on conflict (namespace, object_id) do update set created = excluded.created "
+        "where excluded.created >= object_versions.created",
+        (namespace, object_id, created),
+    )
+    return cur.rowcount == 1
+
+
+def _purge(conn, namespace: str, older_than: float):
+    conn.execute("delete from seen_keys where namespace = ? and seen_at < ?", (namespace, older_than))
+
+
+class DedupeIndex:
+    def __init__(self, namespace: str, window: int = DEDUPE_WINDOW, retention_hours: float = DEDUPE_RETENTION_HOURS):
+        self.namespace = namespace
+        self.window = window
+        self.retention = retention_hours * 3600
+        self.duplicates = 0
+        self._recent = OrderedDict()
+        self._inserts = 0
+
+    def _remember(self, key: str):
+        self._recent[key] = None
+        if len(self._recent) > self.window:
+            self._recent.popitem(last=False)
+
+    async def claim(self, key: str, on_first=None) -> bool:
+        """True ako je ključ viđen prvi put; False za replay
+
+        on_first(conn): dodatni upis u lokalnu bazu u istoj transakciji kao i ključ
+        (npr. inbox row), pa pad procesa ne može ostaviti ključ bez tog upisa.
+        """
+        if key in self._recent:
+            self.duplicates += 1
+            return False
+
+        if on_first is None:
+            first = await run_local(_insert_key, self.namespace, key)
+        else:
+            first = await run_local(_insert_key_with, self.namespace, key, on_first)
+        self._remember(key)
+        if not first:
+            self.duplicates += 1
+            return False
+
+        # Povremeno počisti stare ključeve iz tablice
+        self._inserts += 1
+        if self._inserts % 1000 == 0:
+            await run_local(_purge, self.namespace, time.time() - self.retention)
+        return True
+
+    async def release(self, key: str):
+        """Obrada nije uspjela - dopusti da retry prođe"""
+        self._recent.pop(key, None)
+        await run_local(_delete_key, self.namespace, key)
+
+    def stats(self) -> dict:
+        return {"namespace": self.namespace, "window": len(self._recent), "duplicates": self.duplicates}
+
+
+async def accept_version(namespace: str, object_id: str, created: float) -> bool:
+    """False ako smo za isti objekt već primijenili noviji event (out-of-order zaštita)"""
+    return await run_local(_accept_version, namespace, object_id, created)
+
+
+# Infobip inbound poruke (ključ = messageId)
+inbound_messages = DedupeIndex("infobip_inbound")
+
+# Stripe eventi (ključ = event.id)
+stripe_events = DedupeIndex("stripe_event")
+
+
+register_gauges(
+    "autoping_dedupe_duplicates",
+    "Odbijeni replayi webhookova",
+    lambda: {(index.namespace,): index.duplicates for index in (inbound_messages, stripe_events)},
+    ("namespace",),
+)
@@ -0,0 +1,84 @@
+# jobs.py
+#
+# Periodični pozadinski poslovi (renewal sweep, purge isteklih razgovora, ...).
+# Posao se pokreće iz FastAPI lifespana; kod više workera ga u svakom krugu
+# izvršava samo worker koji drži lease u bazi (sql/005_renewal_sweeper.sql).
+
+import asyncio
+import logging
+import os
+import random
+import socket
+
+from async_db import acquire_job_lease
+from metrics import register_gauges
+
+log = logging.getLogger(__name__)
+
+_holder = f"{socket.gethostname()}:{os.getpid()}"
+_jobs = []
+
+
+class PeriodicJob:
+    def __init__(self, name: str, fn, interval: float, lease_seconds: int = None, enabled: bool = True):
+        """fn: async funkcija bez argumenata koja vraća broj obrađenih stavki"""
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        # Lease traje dulje od intervala → holder ga obnavlja svakim krugom
+        self.lease_seconds = lease_seconds or int(interval * 2)
+        self.enabled = enabled
+        self._task: asyncio.Task = None
+        self._stop: asyncio.Event = None
+        self._stats = {"runs": 0, "skipped": 0, "items": 0, "errors": 0}
+        _jobs.append(self)
+
+    async def run_once(self) -> int:
+        """Jedan krug; vraća broj obrađenih stavki (0 i kad lease drži drugi worker)"""
+        if not await acquire_job_lease(self.name, _holder, self.lease_seconds):
+            self._stats["skipped"] += 1
+            return 0
+        items = await self.fn()
+        self._stats["runs"] += 1
+        self._stats["items"] += items
+        return items
+
+    async def _run(self):
+        # Workeri startaju istovremeno → raspodijeli prvi pokušaj
+        delay = random.uniform(0, min(self.interval, 30))
+        while True:
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.run_once()
+            except Exception:
+                self._stats["errors"] += 1
+                log.exception("❌ Greška u pozadinskom poslu", extra={"job": self.name})
+            delay = self.interval
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+
+def _job_gauges() -> dict:
+    return {(job.name, stat): value for job in _jobs for stat, value in job.stats().items()}
+
+
+register_gauges("autoping_job", "Pozadinski poslovi (runovi, preskočeni bez leasea, obrađene stavke, greške)",
+                _job_gauges, ("job", "stat"))
@@ -0,0 +1,78 @@
+# local_store.py
+#
+# Lokalna SQLite baza za stvari koje moraju preživjeti restart procesa
+# (outbox poruka, ...). Svi pozivi idu kroz jedan thread da konekcija
+# nikad nije dijeljena između threadova.
+
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", "autoping_local.db")
+
+_executor: ThreadPoolExecutor = None
+_conn: sqlite3.Connection = None
+_schema = []
+_columns = []
+
+
+def register_schema(ddl: str):
+    """Modul prijavi svoje tablice; kreiraju se pri otvaranju baze"""
+    _schema.append(ddl)
+    if _conn is not None:
+        _conn.executescript(ddl)
+
+
+def _add_column(conn, table: str, column: str, decl: str):
+    existing = {row[1] for row in conn.execute(f"pragma table_info({table})")}
+    if column not in existing:
+        conn.execute(f"alter table {table} add column {column} {decl}")
+
+
+def register_column(table: str, column: str, decl: str):
+    """Stupac dodan nakon što je tablica već postojala (baza preživljava restart)"""
+    _columns.append((table, column, decl))
+    if _conn is not None:
+        _add_column(_conn, table, column, decl)
+
+
+def _connect() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        # isolation_level=None → autocommit, transakcije eksplicitno s BEGIN IMMEDIATE
+        _conn = sqlite3.connect(LOCAL_DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        _conn.row_factory = sqlite3.Row
+        _conn.execute("pragma journal_mode=wal")
+        _conn.execute("pragma synchronous=normal")
+        for ddl in _schema:
+            _conn.executescript(ddl)
+        for table, column, decl in _columns:
+            _add_column(_conn, table, column, decl)
+    return _conn
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-db")
+    return _executor
+
+
+async def run_local(fn, *args, **kwargs):
+    """Izvrši fn(conn, *args) na local-db threadu"""
+    def call():
+        return fn(_connect(), *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), partial(call))
+
+
+def close_local_store():
+    global _executor, _conn
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _conn is not None:
+        _conn.close()
+        _conn = None
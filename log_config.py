@@ -0,0 +1,118 @@
+# log_config.py
+#
+# Strukturirani logging umjesto print(): JSON linije, razina po modulu,
+# zapis ide kroz queue u zaseban thread (event loop ne čeka stdout), a
+# veliki payloadi se serijaliziraju tek kad se zapis stvarno ispisuje.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# npr. "whatsapp_service=DEBUG,outbox=WARNING"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+# Biblioteke koje na INFO logiraju svaki HTTP request; LOG_LEVELS ih može nadjačati
+DEFAULT_LEVELS = {"httpx": "WARNING", "httpcore": "WARNING", "stripe": "WARNING"}
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Udio zapisa označenih sa SAMPLED koji se stvarno ispišu (raw payloadi)
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+
+# extra=SAMPLED → zapis prolazi samplanje
+SAMPLED = {"sampled": True}
+
+_listener: logging.handlers.QueueListener = None
+
+
+class lazy_json:
+    """json.dumps tek pri formatiranju zapisa (ako zapis uopće prođe level/sampling)"""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __str__(self):
+        return json.dumps(self.obj, ensure_ascii=False, default=str)
+
+
+class JsonFormatter(logging.Formatter):
+    _skip = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "sampled"}
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        # Sve iz extra={...} ide kao zasebno polje
+        for key, value in vars(record).items():
+            if key not in self._skip:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record):
+        if getattr(record, "sampled", False):
+            return random.random() < LOG_PAYLOAD_SAMPLE_RATE
+        return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Standardni QueueHandler formatira zapis u pozivajućem threadu; ovdje
+    # formatiranje (i lazy_json) radi listener thread
+    def prepare(self, record):
+        return record
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for part in spec.split(","):
+        if "=" in part:
+            name, level = part.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Jednom po procesu: root logger → queue → listener thread → stdout"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        stream.formatter.converter = time.gmtime
+
+    handler = _DeferredQueueHandler(queue.SimpleQueue())
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in {**DEFAULT_LEVELS, **_parse_levels(LOG_LEVELS)}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Ispiši sve iz queuea i zaustavi listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
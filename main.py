@@ -1,13 +1,76 @@
 import os
-import json
-from fastapi import FastAPI, HTTPException, Request
-from whatsapp_service import send_whatsapp_template
-from state_memory import set_state, get_state, update_step, clear_state
-from supabase_service import get_business_by_id, save_request
-from stripe_service import router as stripe_router
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from log_config import setup_logging, lazy_json, SAMPLED
 
+setup_logging()
 
-app = FastAPI()
+from whatsapp_service import start_infobip_client, close_infobip_client, infobip_client_ready
+from outbox import enqueue_template, start_outbox, stop_outbox, outbox_running
+from template_utils import load_templates
+from renewals import renewal_job
+from state_purge import purge_job
+from local_store import close_local_store
+from dedupe import inbound_messages
+from coalesce import claim_missed_call, release_missed_call
+import quota
+from async_db import (
+    set_state, update_step, pop_state,
+    get_business_by_id, run_db, shutdown_db_executor,
+)
+from request_writer import save_request, close_request_writer
+from stripe_service import (
+    router as stripe_router, start_stripe_worker, stop_stripe_worker,
+    get_stripe, stripe_ready, run_stripe,
+)
+import metrics
+from metrics import WEBHOOK_RESULTS_TOTAL
+from supabase_client import get_supabase, supabase_ready, close_supabase
+
+log = logging.getLogger(__name__)
+
+
+async def _warm_up():
+    # Supabase i Stripe SDK se grade u pozadini → worker prima promet odmah, /healthz javlja kad su spremni
+    try:
+        await asyncio.gather(run_db(get_supabase), run_stripe(get_stripe))
+        log.info("✅ Klijenti zagrijani")
+    except Exception:
+        log.exception("❌ Zagrijavanje klijenata nije uspjelo (grade se pri prvom korištenju)")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ➡️ Neispravan template_map obara start, a ne prvu poruku
+    load_templates()
+    # ➡️ Jedan dijeljeni Infobip klijent (keep-alive + HTTP/2) za cijeli proces
+    await start_infobip_client()
+    # ➡️ Outbox workeri šalju poruke u pozadini
+    await start_outbox()
+    await start_stripe_worker()
+    # ➡️ Periodični poslovi: mjesečni reset used_request, purge isteklih razgovora (lease → jedan worker)
+    await renewal_job.start()
+    await purge_job.start()
+    warm_task = asyncio.create_task(_warm_up())
+    try:
+        yield
+    finally:
+        warm_task.cancel()
+        await purge_job.stop()
+        await renewal_job.stop()
+        await stop_stripe_worker()
+        await stop_outbox()
+        await close_request_writer()
+        await quota.drain()
+        await close_infobip_client()
+        close_local_store()
+        shutdown_db_executor()
+        close_supabase()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(stripe_router, prefix="/api") 
 
 @app.get("/debug")
@@ -22,10 +85,33 @@ def debug():
     except Exception as e:
         return {"key_start": key[:20], "error": str(e)}
 
+@app.get("/healthz")
+async def healthz(response: Response):
+    """Readiness: 200 tek kad su dijeljeni klijenti i pozadinski workeri spremni"""
+    checks = {
+        "infobip_client": infobip_client_ready(),
+        "supabase_client": supabase_ready(),
+        "stripe_sdk": stripe_ready(),
+        "outbox": outbox_running(),
+    }
+    ready = all(checks.values())
+    if not ready:
+        response.status_code = 503
+    return {"status": "ready" if ready else "warming", "checks": checks}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return Response(await metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ========================
 # Utils
 # ========================
 
+# Koliko poruka iz jednog Infobip batcha se obrađuje istovremeno
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "10"))
+
 def _norm_phone(msisdn: str) -> str:
     msisdn = (msisdn or "").replace(" ", "")
     return msisdn if msisdn.startswith("+") else f"+{msisdn}"
@@ -36,94 +122,161 @@ def _norm_phone(msisdn: str) -> str:
 
 @app.post("/missed-call")
 async def handle_missed_call(payload: dict):
-    print("📩 Raw /missed-call payload:", payload)
+    log.debug("📩 Raw /missed-call payload: %s", lazy_json(payload), extra=SAMPLED)
 
     phone = payload.get("phone_number")
     business_id = payload.get("business_id")
     profession = payload.get("profession")
 
-    print("➡️ phone_number:", phone)
-    print("➡️ business_id:", business_id)
-    print("➡️ profession:", profession)
+    log.info("➡️ Missed call", extra={"phone": phone, "business_id": business_id, "profession": profession})
 
     if not phone or not profession or not business_id:
         raise HTTPException(status_code=400, detail="Missing phone_number, business_id or profession")
 
-    # ➡️ Snimi state u Supabase (intro stage)
-    set_state(_norm_phone(phone), profession, "intro", business_id)
+    to_number = _norm_phone(phone)
 
-    # ➡️ Dohvati ime obrta
-    business = get_business_by_id(business_id)
-    business_name = business["name"] if business else "Naš obrt"
+    # ➡️ Ponovljeni poziv unutar prozora koristi već poslani intro (bez DB i Infobip poziva)
+    if not await claim_missed_call(to_number, business_id):
+        log.info("🔁 Ponovljeni missed call, intro već poslan", extra={"phone": to_number, "business_id": business_id})
+        WEBHOOK_RESULTS_TOTAL.inc(endpoint="missed_call", result="coalesced")
+        return {"status": "coalesced", "profession": profession, "phone_number": phone}
 
-    # ➡️ Pošalji intro poruku (s imenom za placeholder {{1}})
-    await send_whatsapp_template(
-        to_number=_norm_phone(phone),
-        profession=profession,
-        stage="pm_intro",
-        placeholders=[business_name]  # ✅ ime obrta u poruci
-    )
+    try:
+        # ➡️ Business preko mjesečnog limita ne šalje (plaćene) template poruke
+        if not await quota.can_send(business_id):
+            log.warning("⛔ Limit zahtjeva dosegnut", extra={"business_id": business_id})
+            WEBHOOK_RESULTS_TOTAL.inc(endpoint="missed_call", result="quota_exceeded")
+            await release_missed_call(to_number, business_id)
+            return {"status": "quota_exceeded", "profession": profession, "phone_number": phone}
+
+        # ➡️ Snimi state u Supabase (intro stage) i paralelno dohvati ime obrta
+        _, business = await asyncio.gather(
+            set_state(to_number, profession, "intro", business_id),
+            get_business_by_id(business_id),
+        )
+        business_name = business["name"] if business else "Naš obrt"
 
+        # ➡️ Stavi intro poruku u outbox (s imenom za placeholder {{1}})
+        await enqueue_template(
+            to_number=to_number,
+            profession=profession,
+            stage="pm_intro",
+            placeholders=[business_name]  # ✅ ime obrta u poruci
+        )
+    except Exception:
+        await release_missed_call(to_number, business_id)
+        raise
+
+    WEBHOOK_RESULTS_TOTAL.inc(endpoint="missed_call", result="intro_queued")
     return {"status": "intro_sent", "profession": profession, "phone_number": phone, "business_name": business_name}
 
 # ========================
 # Endpoint: Infobip webhook
 # ========================
 
-@app.post("/infobip-webhook")
-async def receive_message(request: Request):
-    data = await request.json()
-    print("📩 Raw /infobip-webhook payload:", json.dumps(data, ensure_ascii=False))
+async def _process_result(from_number: str, result: dict):
+    message = result.get("message", {})
+    text = message.get("text", "").strip()
+    button_payload = message.get("payload")
 
-    results = data.get("results", [])
-    for result in results:
-        from_number = _norm_phone(result.get("from"))
-        message = result.get("message", {})
-        text = message.get("text", "").strip()
-        button_payload = message.get("payload")
+    log.info("➡️ Inbound poruka", extra={"phone": from_number, "has_text": bool(text), "button": button_payload})
 
-        print(f"➡️ From {from_number} | text='{text}' | button={button_payload}")
-
-        # ➡️ Dohvati state iz Supabase
-        state = get_state(from_number)
+    if button_payload:
+        # ➡️ Prebaci u details i dobij state u istom pozivu
+        state = await update_step(from_number, "details")
         if not state:
-            print("⚠️ Nema state-a za", from_number)
-            continue
+            log.info("⚠️ Nema state-a", extra={"phone": from_number})
+            return "no_state"
 
-        profession = state["profession"]
-        business_id = state["business_id"]
-        step = state["step"]
+        log.info("🔘 Kliknut gumb", extra={"phone": from_number, "button": button_payload})
+        await enqueue_template(
+            to_number=from_number,
+            profession=state["profession"],
+            stage="pm_details"
+        )
+        return "details_sent"
 
-        if button_payload:
-            print("🔘 Kliknut gumb:", button_payload)
-            update_step(from_number, "details")
+    elif text:
+        # ➡️ Preuzmi i očisti state samo ako čekamo detalje (jedan poziv)
+        state = await pop_state(from_number, step="details")
+        if not state:
+            log.info("⚠️ Nema state-a (details)", extra={"phone": from_number})
+            return "no_state"
 
-            await send_whatsapp_template(
-                to_number=from_number,
-                profession=profession,
-                stage="pm_details"
-            )
+        profession = state["profession"]
+        log.info("📝 Dobiveni detalji od korisnika", extra={"phone": from_number})
+        log.debug("📝 Detalji: %s", text)
 
-        elif step == "details" and text:
-            print("📝 Dobiveni detalji od korisnika:", text)
+        # ➡️ Potroši jedan zahtjev iz limita (atomarno u bazi)
+        if not await quota.consume(state["business_id"]):
+            log.warning("⛔ Limit zahtjeva dosegnut, zahtjev se ne sprema", extra={"business_id": state["business_id"]})
+            return "quota_exceeded"
 
-            # ➡️ Spremi zahtjev u requests tablicu
-            save_request(
+        # ➡️ Spremi zahtjev u requests tablicu (batch insert, čeka se upis ovog rowa)
+        try:
+            await save_request(
                 phone_number=from_number,
-                business_id=business_id,
+                business_id=state["business_id"],
                 profession=profession,
                 message=text,
                 request_type="booking_service"
             )
+        except Exception:
+            log.exception("❌ Zahtjev nije spremljen, vraćam limit i state", extra={"phone": from_number})
+            # Infobip retry (dedupe ključ se oslobađa na grešku) mora opet naći state i limit
+            await quota.refund(state["business_id"])
+            await set_state(from_number, profession, "details", state["business_id"])
+            raise
 
-            # ➡️ Očisti state
-            clear_state(from_number)
+        # ➡️ Stavi confirmation template u outbox
+        await enqueue_template(
+            to_number=from_number,
+            profession=profession,
+            stage="pm_confirmation"
+        )
+        return "request_saved"
 
-            # ➡️ Pošalji confirmation template
-            await send_whatsapp_template(
-                to_number=from_number,
-                profession=profession,
-                stage="pm_confirmation"
-            )
+    return "ignored"
+
+
+async def _process_sender(from_number: str, results: list, semaphore: asyncio.Semaphore):
+    # Poruke s istog broja idu strogo redom (klik na gumb pa tek onda detalji)
+    for result in results:
+        async with semaphore:
+            # ➡️ Infobip retry iste poruke se preskače
+            message_id = result.get("messageId")
+            if message_id and not await inbound_messages.claim(message_id):
+                log.info("♻️ Duplikat poruke, preskačem", extra={"message_id": message_id})
+                WEBHOOK_RESULTS_TOTAL.inc(endpoint="infobip", result="duplicate")
+                continue
+            try:
+                outcome = await _process_result(from_number, result)
+                WEBHOOK_RESULTS_TOTAL.inc(endpoint="infobip", result=outcome)
+            except Exception:
+                WEBHOOK_RESULTS_TOTAL.inc(endpoint="infobip", result="error")
+                if message_id:
+                    await inbound_messages.release(message_id)
+                raise
+
+
+@app.post("/infobip-webhook")
+async def receive_message(request: Request):
+    data = await request.json()
+    log.debug("📩 Raw /infobip-webhook payload: %s", lazy_json(data), extra=SAMPLED)
+
+    # ➡️ Grupiraj po pošiljatelju (redoslijed unutar grupe ostaje isti)
+    by_sender = {}
+    for result in data.get("results", []):
+        by_sender.setdefault(_norm_phone(result.get("from")), []).append(result)
+
+    # ➡️ Različiti pošiljatelji paralelno, ali najviše WEBHOOK_CONCURRENCY poruka odjednom
+    semaphore = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+    outcomes = await asyncio.gather(
+        *(_process_sender(number, results, semaphore) for number, results in by_sender.items()),
+        return_exceptions=True,
+    )
+    errors = [o for o in outcomes if isinstance(o, BaseException)]
+    if errors:
+        raise errors[0]
 
     return {"status": "webhook_processed"}
@@ -0,0 +1,156 @@
+# metrics.py
+#
+# Minimalni Prometheus metrički sloj (counter, histogram, gauge iz callbacka)
+# bez vanjske ovisnosti. S METRICS_ENABLED=false sve je no-op.
+
+import inspect
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_registry = []
+_callbacks = []
+
+
+def _label_str(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v).replace(chr(34), chr(39))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels) if METRICS_ENABLED else _NOOP_TIMER
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for key, (counts, total, count) in sorted(self._values.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_label_str(names, key + (bound,))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_label_str(names, key + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def register_gauges(name: str, help: str, fn, labelnames=()):
+    """
+    Gauge koji se čita tek pri scrapeu. fn (sync ili async) vraća broj ili
+    dict {label_tuple: broj} za zadane labelnames.
+    """
+    _callbacks.append((name, help, fn, tuple(labelnames)))
+
+
+async def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+
+    for name, help, fn, labelnames in _callbacks:
+        try:
+            value = fn()
+            if inspect.isawaitable(value):
+                value = await value
+        except Exception:
+            continue
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for key, v in sorted(value.items()):
+                key = key if isinstance(key, tuple) else (key,)
+                if v is not None:
+                    lines.append(f"{name}{_label_str(labelnames, key)} {v}")
+        elif value is not None:
+            lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+# ========================
+# Hot-path metrike
+# ========================
+
+DB_SECONDS = Histogram("autoping_db_seconds", "Trajanje Supabase poziva po operaciji", ("op",))
+INFOBIP_SECONDS = Histogram("autoping_infobip_request_seconds", "Trajanje Infobip template requesta", ("status",))
+STRIPE_EVENT_SECONDS = Histogram(
+    "autoping_stripe_event_seconds", "Trajanje primjene Stripe eventa po tipu", ("event_type", "result")
+)
+TEMPLATES_TOTAL = Counter("autoping_templates_total", "Poslane template poruke po tipu i stageu", ("template_type", "stage"))
+WEBHOOK_RESULTS_TOTAL = Counter("autoping_webhook_results_total", "Ishodi webhookova", ("endpoint", "result"))
+COALESCE_SAVED_TOTAL = Counter(
+    "autoping_coalesce_saved_total", "Ušteđeni pozivi zbog spojenih ponovljenih missed callova", ("kind",)
+)
@@ -0,0 +1,242 @@
+# outbox.py
+#
+# Trajni outbox za WhatsApp poruke. Endpoint samo upiše poruku u lokalnu
+# SQLite bazu i vrati odgovor; background workeri je šalju prema Infobipu,
+# s exponential backoffom + jitterom, a nakon OUTBOX_MAX_ATTEMPTS pokušaja
+# poruka ide u dead-letter tablicu.
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+import httpx
+
+from local_store import register_schema, run_local
+from metrics import register_gauges
+from whatsapp_service import build_template_message, send_message
+
+log = logging.getLogger(__name__)
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "4"))
+OUTBOX_CLAIM_BATCH = int(os.getenv("OUTBOX_CLAIM_BATCH", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "1"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1"))
+# Koliko dugo je poruka "zauzeta" - ako worker padne, nakon toga je preuzima drugi
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", "60"))
+
+register_schema("""
+create table if not exists outbox (
+    id integer primary key autoincrement,
+    message text not null,
+    attempts integer not null default 0,
+    next_attempt_at real not null,
+    claimed_until real not null default 0,
+    last_error text,
+    created_at real not null
+);
+create index if not exists outbox_due on outbox (next_attempt_at);
+
+create table if not exists outbox_dead_letter (
+    id integer primary key,
+    message text not null,
+    attempts integer not null,
+    last_error text,
+    created_at real not null,
+    failed_at real not null
+);
+""")
+
+_workers = []
+_wakeup: asyncio.Event = None
+_stopping = False
+
+# ========================
+# SQLite operacije (izvršavaju se na local-db threadu)
+# ========================
+
+def _insert(conn, message: str) -> int:
+    now = time.time()
+    cur = conn.execute(
+        "insert into outbox (message, next_attempt_at, created_at) values (?, ?, ?)",
+        (message, now, now),
+    )
+    return cur.lastrowid
+
+
+def _claim(conn, limit: int) -> list:
+    now = time.time()
+    conn.execute("begin immediate")
+    try:
+        rows = conn.execute(
+            "select id, message, attempts, created_at from outbox "
+            "where next_attempt_at <= ? and claimed_until <= ? order by id limit ?",
+            (now, now, limit),
+        ).fetchall()
+        if rows:
+            conn.executemany(
+                "update outbox set claimed_until = ? where id = ?",
+                [(now + OUTBOX_CLAIM_TIMEOUT, row["id"]) for row in rows],
+            )
+        conn.execute("commit")
+    except Exception:
+        conn.execute("rollback")
+        raise
+    return [dict(row) for row in rows]
+
+
+def _ack(conn, outbox_id: int):
+    conn.execute("delete from outbox where id = ?", (outbox_id,))
+
+
+def _retry_later(conn, outbox_id: int, attempts: int, delay: float, error: str):
+    conn.execute(
+        "update outbox set attempts = ?, next_attempt_at = ?, claimed_until = 0, last_error = ? where id = ?",
+        (attempts, time.time() + delay, error, outbox_id),
+    )
+
+
+def _dead_letter(conn, row: dict, attempts: int, error: str):
+    conn.execute("begin immediate")
+    try:
+        conn.execute(
+            "insert or replace into outbox_dead_letter (id, message, attempts, last_error, created_at, failed_at) "
+            "values (?, ?, ?, ?, ?, ?)",
+            (row["id"], row["message"], attempts, error, row["created_at"], time.time()),
+        )
+        conn.execute("delete from outbox where id = ?", (row["id"],))
+        conn.execute("commit")
+    except Exception:
+        conn.execute("rollback")
+        raise
+
+
+def _stats(conn) -> dict:
+    now = time.time()
+    pending, oldest = conn.execute("select count(*), min(created_at) from outbox").fetchone()
+    dead = conn.execute("select count(*) from outbox_dead_letter").fetchone()[0]
+    return {
+        "pending": pending,
+        "oldest_age_seconds": round(now - oldest, 3) if oldest else 0,
+        "dead_letter": dead,
+    }
+
+# ========================
+# Public API
+# ========================
+
+async def enqueue_template(to_number: str, profession: str, stage: str, placeholders: list = None) -> int:
+    """Validiraj i upiši poruku u outbox; slanje ide u pozadini"""
+    # Krivi profession/stage puca odmah, ne tek u workeru
+    message = build_template_message(to_number, profession, stage, placeholders)
+    outbox_id = await run_local(_insert, json.dumps(message, ensure_ascii=False))
+    if _wakeup is not None:
+        _wakeup.set()
+    return outbox_id
+
+
+async def outbox_stats() -> dict:
+    return await run_local(_stats)
+
+
+async def _outbox_gauges() -> dict:
+    stats = await outbox_stats()
+    return {(key,): value for key, value in stats.items()}
+
+
+register_gauges("autoping_outbox", "Outbox poruke (pending, dead-letter, starost)", _outbox_gauges, ("stat",))
+
+
+def _backoff(attempts: int) -> float:
+    # Full jitter: random između 0 i eksponencijalne granice
+    return random.uniform(0, min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1)))
+
+
+def _is_permanent(error: Exception) -> bool:
+    # 4xx (osim 429) se neće popraviti ponavljanjem
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return 400 <= status < 500 and status != 429
+    return False
+
+
+async def _send(row: dict):
+    try:
+        await send_message(json.loads(row["message"]))
+    except Exception as e:
+        attempts = row["attempts"] + 1
+        error = f"{type(e).__name__}: {e}"
+        if attempts >= OUTBOX_MAX_ATTEMPTS or _is_permanent(e):
+            log.error("💀 Poruka u dead-letter", extra={"outbox_id": row["id"], "attempts": attempts, "error": error})
+            await run_local(_dead_letter, row, attempts, error)
+        else:
+            delay = _backoff(attempts)
+            log.warning("🔁 Slanje nije uspjelo, ponovni pokušaj", extra={
+                "outbox_id": row["id"], "attempts": attempts, "retry_in": round(delay, 1), "error": error,
+            })
+            await run_local(_retry_later, row["id"], attempts, delay, error)
+        return
+
+    await run_local(_ack, row["id"])
+
+
+async def _deliver(row: dict):
+    try:
+        await _send(row)
+    except Exception:
+        # Greška u outbox tablici ne smije ugasiti worker; row ostaje zauzet
+        # do isteka OUTBOX_CLAIM_TIMEOUT i onda se ponovno pokušava
+        log.exception("❌ Greška pri zapisu ishoda slanja u outbox", extra={"outbox_id": row["id"]})
+
+
+async def _worker():
+    while not _stopping:
+        try:
+            rows = await run_local(_claim, OUTBOX_CLAIM_BATCH)
+        except Exception:
+            log.exception("❌ Greška pri dohvaćanju poruka iz outboxa")
+            rows = []
+
+        if not rows:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+            continue
+
+        # Sve poruke iz claima paralelno → Infobip batcher ih spoji u jedan request
+        await asyncio.gather(*(_deliver(row) for row in rows))
+
+
+def outbox_running() -> bool:
+    # Worker koji je ipak izašao (neuhvaćena greška) znači da se ništa ne šalje
+    return bool(_workers) and not _stopping and all(not task.done() for task in _workers)
+
+
+async def start_outbox():
+    global _wakeup, _stopping
+    if _workers:
+        return
+    _stopping = False
+    _wakeup = asyncio.Event()
+    for _ in range(OUTBOX_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def stop_outbox(timeout: float = 10):
+    """Pusti workere da dovrše poruke u letu; ostalo ostaje u outboxu za idući start"""
+    global _stopping
+    _stopping = True
+    if _wakeup is not None:
+        _wakeup.set()
+    if _workers:
+        _, pending = await asyncio.wait(_workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    _workers.clear()
@@ -0,0 +1,226 @@
+# quota.py
+#
+# Provjera i potrošnja mjesečnog limita zahtjeva (subscriptions.used_request).
+#
+# Lokalni "bucket" po businessu pamti zadnji poznati used_request iz baze i
+# broj lokalno odobrenih zahtjeva čiji increment još nije potvrđen ("u letu").
+# Zastario snapshot se osvježava u pozadini (odgovor ide iz zadnjeg poznatog),
+# pa business s rijetkim pozivima ne plaća dodatni round trip na svakom callu.
+# Dok ima dovoljno rezerve, potrošnja se odobri lokalno a atomarni increment
+# u bazi ide u pozadini (bez dodatne latencije). Blizu limita svaka potrošnja
+# čeka atomarni consume_request_quota RPC. Zahtjevi u letu ne mogu pojesti
+# više od rezerve iznad QUOTA_LOCAL_HEADROOM, pa unutar jednog procesa limit
+# nikad nije prekoračen. S više procesa svaki lokalno troši samo svoj dio
+# rezerve (QUOTA_WORKERS); prekoračenje je moguće tek kad je snapshot jednog
+# procesa zastario za više od rezerve koju su drugi u međuvremenu potrošili.
+
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from async_db import consume_request_quota, get_subscription_usage, refund_request_quota
+
+log = logging.getLogger(__name__)
+
+# Ispod ove rezerve svaka potrošnja ide sinkrono kroz bazu
+QUOTA_LOCAL_HEADROOM = int(os.getenv("QUOTA_LOCAL_HEADROOM", "5"))
+QUOTA_REFRESH_SECONDS = float(os.getenv("QUOTA_REFRESH_SECONDS", "60"))
+# Broj procesa (uvicorn workera) koji dijele istu rezervu
+QUOTA_WORKERS = max(1, int(os.getenv("QUOTA_WORKERS", os.getenv("WEB_CONCURRENCY", "1"))))
+
+WARNING_RATIO = 0.8
+
+
+def usage_flags(used: int, limit) -> dict:
+    """can_send / warning za zadani used_request i request_limit"""
+    warning = None
+    if limit and limit > 0 and used >= int(limit * WARNING_RATIO) and used < limit:
+        warning = "You are close to your monthly limit"
+
+    can_send = True
+    if limit and limit > 0 and used >= limit:
+        can_send = False
+
+    return {"can_send": can_send, "warning": warning}
+
+
+class _Bucket:
+    __slots__ = ("used", "limit", "in_flight", "pending", "observed", "refreshing", "refreshed_at")
+
+    def __init__(self):
+        self.used = 0
+        # None = bez ograničenja
+        self.limit = None
+        # Lokalno odobreno, increment u bazi još nije potvrđen
+        self.in_flight = 0
+        # Taskovi tih incremenata (refund ih čeka)
+        self.pending = set()
+        # Broj odgovora consume RPC-a (snapshot čitan prije nekog od njih je stariji)
+        self.observed = 0
+        self.refreshing = False
+        self.refreshed_at = float("-inf")
+
+    def observe(self, used: int, limit, snapshot: bool = False):
+        # Odgovori incremenata stižu izvan redoslijeda → used samo raste;
+        # snapshot (refresh nakon reseta / isteka) ga smije i spustiti
+        used = used or 0
+        self.used = used if snapshot else max(self.used, used)
+        self.limit = limit if limit and limit > 0 else None
+        self.refreshed_at = time.monotonic()
+        if not snapshot:
+            self.observed += 1
+
+    @property
+    def remaining(self):
+        # Snapshot iz baze ne sadrži incremente u letu
+        if self.limit is None:
+            return None
+        return self.limit - self.used - self.in_flight
+
+    @property
+    def local_ok(self) -> bool:
+        if self.limit is None:
+            return True
+        budget = (self.limit - self.used - QUOTA_LOCAL_HEADROOM) // QUOTA_WORKERS
+        return self.in_flight < budget
+
+    @property
+    def fresh(self) -> bool:
+        return time.monotonic() - self.refreshed_at < QUOTA_REFRESH_SECONDS
+
+    @property
+    def loaded(self) -> bool:
+        # Novi ili resetiran bucket nema snapshot iz kojeg se smije odgovoriti
+        return self.refreshed_at != float("-inf")
+
+
+_buckets = {}
+_lock = threading.Lock()
+_background = set()
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.get_running_loop().create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+def _get(business_id: str) -> _Bucket:
+    bucket = _buckets.get(business_id)
+    if bucket is None:
+        with _lock:
+            bucket = _buckets.setdefault(business_id, _Bucket())
+    return bucket
+
+
+def reset(business_id: str):
+    """Označi lokalni bucket zastarjelim (nakon reseta/promjene limita u bazi)"""
+    # Bucket ostaje zbog in_flight brojača; idući poziv ga osvježi iz baze
+    bucket = _buckets.get(business_id)
+    if bucket is not None:
+        with _lock:
+            bucket.refreshed_at = float("-inf")
+
+
+async def _refresh(business_id: str, bucket: _Bucket):
+    observed = bucket.observed
+    usage = await get_subscription_usage(business_id) or {}
+    with _lock:
+        # Increment potvrđen dok je snapshot bio u letu → snapshot ne smije spustiti used
+        snapshot = bucket.observed == observed
+        bucket.observe(usage.get("used_request", 0), usage.get("request_limit"), snapshot=snapshot)
+
+
+async def _refresh_later(business_id: str, bucket: _Bucket):
+    try:
+        await _refresh(business_id, bucket)
+    except Exception:
+        log.exception("❌ Greška pri osvježavanju quote", extra={"business_id": business_id})
+    finally:
+        bucket.refreshing = False
+
+
+async def _bucket(business_id: str) -> _Bucket:
+    bucket = _get(business_id)
+    if bucket.fresh:
+        return bucket
+    if bucket.loaded:
+        # Stale-while-revalidate: odgovori iz zadnjeg snapshota, osvježi u pozadini
+        if not bucket.refreshing:
+            bucket.refreshing = True
+            _spawn(_refresh_later(business_id, bucket))
+        return bucket
+    await _refresh(business_id, bucket)
+    return bucket
+
+
+async def can_send(business_id: str) -> bool:
+    """Pre-check bez potrošnje (npr. prije intro poruke)"""
+    bucket = await _bucket(business_id)
+    remaining = bucket.remaining
+    return remaining is None or remaining > 0
+
+
+async def _consume_in_db(business_id: str, bucket: _Bucket, local: bool = False) -> bool:
+    try:
+        result = await consume_request_quota(business_id)
+    finally:
+        if local:
+            with _lock:
+                bucket.in_flight -= 1
+    if not result:
+        return True
+    with _lock:
+        bucket.observe(result["used_request"], result["request_limit"])
+    return bool(result["allowed"])
+
+
+async def _consume_later(business_id: str, bucket: _Bucket):
+    try:
+        if not await _consume_in_db(business_id, bucket, local=True):
+            log.warning("⚠️ Limit dosegnut u pozadinskom incrementu", extra={"business_id": business_id})
+    except Exception:
+        log.exception("❌ Greška pri incrementu used_request")
+        reset(business_id)
+
+
+async def consume(business_id: str) -> bool:
+    """Potroši jedan zahtjev; False ako je business preko limita"""
+    bucket = await _bucket(business_id)
+
+    with _lock:
+        local_ok = bucket.local_ok
+        if local_ok:
+            bucket.in_flight += 1
+
+    if local_ok:
+        # Puno rezerve → odobri odmah, increment u bazi ide u pozadini
+        task = _spawn(_consume_later(business_id, bucket))
+        bucket.pending.add(task)
+        task.add_done_callback(bucket.pending.discard)
+        return True
+
+    return await _consume_in_db(business_id, bucket)
+
+
+async def refund(business_id: str):
+    """Vrati jedan potrošeni zahtjev (zahtjev ipak nije upisan)"""
+    # Povrat prije pozadinskog incrementa bi se odrezao na 0, a increment bi ostao
+    bucket = _buckets.get(business_id)
+    if bucket is not None and bucket.pending:
+        await asyncio.gather(*bucket.pending, return_exceptions=True)
+    try:
+        await refund_request_quota(business_id)
+    except Exception:
+        log.exception("❌ Greška pri povratu used_request", extra={"business_id": business_id})
+    # used u bucketu samo raste → idući poziv ga osvježi iz baze
+    reset(business_id)
+
+
+async def drain():
+    """Pričekaj pozadinske incremente (pri gašenju)"""
+    if _background:
+        await asyncio.gather(*_background, return_exceptions=True)
@@ -0,0 +1,37 @@
+# renewals.py
+#
+# Mjesečni reset usagea: jednim set-based updateom resetira used_request svim
+# pretplatama kojima je prošao renewal_date (sql/005_renewal_sweeper.sql),
+# neovisno o tome je li stigao invoice webhook.
+
+import logging
+import os
+
+import quota
+from async_db import sweep_subscription_renewals
+from jobs import PeriodicJob
+
+log = logging.getLogger(__name__)
+
+RENEWAL_SWEEP_ENABLED = os.getenv("RENEWAL_SWEEP_ENABLED", "true").lower() in ("1", "true", "yes")
+RENEWAL_SWEEP_INTERVAL = float(os.getenv("RENEWAL_SWEEP_INTERVAL", "300"))
+RENEWAL_LEASE_SECONDS = int(os.getenv("RENEWAL_LEASE_SECONDS", str(int(RENEWAL_SWEEP_INTERVAL * 2))))
+
+
+async def sweep_renewals() -> int:
+    business_ids = await sweep_subscription_renewals()
+    # Lokalni bucketi još misle da je limit potrošen
+    for business_id in business_ids:
+        quota.reset(business_id)
+    if business_ids:
+        log.info("🔄 Mjesečni reset zahtjeva", extra={"subscriptions": len(business_ids)})
+    return len(business_ids)
+
+
+renewal_job = PeriodicJob(
+    "subscription_renewals",
+    sweep_renewals,
+    interval=RENEWAL_SWEEP_INTERVAL,
+    lease_seconds=RENEWAL_LEASE_SECONDS,
+    enabled=RENEWAL_SWEEP_ENABLED,
+)
@@ -0,0 +1,110 @@
+# request_writer.py
+#
+# Write-behind za requests tablicu: zahtjevi iz kratkog prozora idu u bazu
+# jednim multi-row insertom. Svaki pozivatelj čeka rezultat svog rowa, pa
+# se pm_confirmation šalje tek kad je zahtjev stvarno upisan.
+
+import asyncio
+import logging
+import os
+import random
+
+import httpx
+
+import supabase_service
+from async_db import insert_requests
+from batching import MicroBatcher
+from metrics import DB_SECONDS, register_gauges
+
+log = logging.getLogger(__name__)
+
+REQUESTS_BATCH_ENABLED = os.getenv("REQUESTS_BATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+REQUESTS_BATCH_MAX = int(os.getenv("REQUESTS_BATCH_MAX", "100"))
+REQUESTS_BATCH_WINDOW_MS = float(os.getenv("REQUESTS_BATCH_WINDOW_MS", "50"))
+# Najviše rowova u bufferu + u letu; iznad toga save_request čeka
+REQUESTS_BATCH_MAX_PENDING = int(os.getenv("REQUESTS_BATCH_MAX_PENDING", "1000"))
+REQUESTS_INSERT_RETRIES = int(os.getenv("REQUESTS_INSERT_RETRIES", "3"))
+REQUESTS_RETRY_BACKOFF = float(os.getenv("REQUESTS_RETRY_BACKOFF", "0.2"))
+
+_batcher: MicroBatcher = None
+
+
+# Request sigurno nije stigao do baze → ponavljanje ne može duplicirati row
+_RETRYABLE = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+async def _insert_with_retry(rows: list) -> list:
+    for attempt in range(REQUESTS_INSERT_RETRIES + 1):
+        try:
+            return await insert_requests(rows)
+        except _RETRYABLE:
+            if attempt == REQUESTS_INSERT_RETRIES:
+                raise
+            # Full jitter backoff
+            await asyncio.sleep(random.uniform(0, REQUESTS_RETRY_BACKOFF * 2 ** attempt))
+
+
+async def _insert_one(row: dict) -> dict:
+    inserted = await _insert_with_retry([row])
+    if not inserted:
+        raise RuntimeError("Insert u requests nije vratio row")
+    return inserted[0]
+
+
+async def _flush(rows: list) -> list:
+    try:
+        inserted = await _insert_with_retry(rows)
+    except httpx.TransportError:
+        # Ishod nepoznat (npr. timeout nakon slanja) → ne pokušavaj ponovno, javi grešku svima
+        raise
+    except Exception:
+        if len(rows) == 1:
+            raise
+        # Baza je odbila batch (npr. jedan neispravan row) → svaki row zasebno
+        log.warning("⚠️ Batch insert u requests odbijen, upisujem pojedinačno", extra={"rows": len(rows)})
+        return await asyncio.gather(*(_insert_one(row) for row in rows), return_exceptions=True)
+
+    if len(inserted) != len(rows):
+        return [RuntimeError("Insert u requests nije vratio sve rowove") for _ in rows]
+    return inserted
+
+
+def _get_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            _flush,
+            max_batch=REQUESTS_BATCH_MAX,
+            max_delay=REQUESTS_BATCH_WINDOW_MS / 1000,
+            name="requests_insert",
+            max_pending=REQUESTS_BATCH_MAX_PENDING,
+        )
+    return _batcher
+
+
+async def save_request(**kwargs) -> dict:
+    """Upiši zahtjev i vrati upisani row; baca iznimku ako row nije upisan"""
+    row = supabase_service.build_request_row(**kwargs)
+    # Latencija po zahtjevu (uključuje čekanje u batch prozoru); insert_requests mjeri batch
+    with DB_SECONDS.time(op="save_request"):
+        if not REQUESTS_BATCH_ENABLED:
+            return await _insert_one(row)
+        return await _get_batcher().submit(row)
+
+
+async def close_request_writer():
+    """Upiši sve što čeka u bufferu (lifespan shutdown, prije gašenja DB poola)"""
+    global _batcher
+    if _batcher is not None:
+        await _batcher.close()
+        _batcher = None
+
+
+def _batch_stats() -> dict:
+    if _batcher is None:
+        return {}
+    stats = _batcher.stats()
+    return {("batches",): stats["batches"], ("rows",): stats["items"], ("pending",): stats["pending"]}
+
+
+register_gauges("autoping_requests_batch", "Write-behind insert u requests (batchevi, rowovi, buffer)", _batch_stats, ("kind",))
@@ -0,0 +1,9 @@
+-- user_states: jedan row po broju, potrebno za upsert(on_conflict="phone")
+
+-- Očisti duplikate koje je ostavio stari delete + insert
+delete from user_states a
+using user_states b
+where a.phone = b.phone
+  and a.ctid < b.ctid;
+
+create unique index if not exists user_states_phone_key on user_states (phone);
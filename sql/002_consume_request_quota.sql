@@ -0,0 +1,33 @@
+-- Atomarni increment-and-check za subscriptions.used_request (jedan round trip)
+--
+-- allowed = false ako bi increment prešao request_limit (used_request se tada ne mijenja).
+-- Business bez subscription rowa ili s request_limit <= 0 nema ograničenje.
+
+create or replace function consume_request_quota(p_business_id uuid, p_amount int default 1)
+returns table (allowed boolean, used_request int, request_limit int)
+language plpgsql
+as $$
+begin
+    return query
+    update subscriptions s
+       set used_request = s.used_request + p_amount
+     where s.business_id = p_business_id
+       and (s.request_limit is null
+            or s.request_limit <= 0
+            or s.used_request + p_amount <= s.request_limit)
+    returning true, s.used_request, s.request_limit;
+
+    if not found then
+        return query
+        select false, s.used_request, s.request_limit
+          from subscriptions s
+         where s.business_id = p_business_id;
+
+        if not found then
+            return query select true, 0, null::int;
+        end if;
+    end if;
+end;
+$$;
+
+create index if not exists subscriptions_business_id_idx on subscriptions (business_id);
@@ -0,0 +1,36 @@
+-- Stripe podaci o pretplati čuvaju se u businesses (puni ih webhook),
+-- pa dashboard overview ne treba live Stripe poziv.
+
+alter table businesses
+    add column if not exists stripe_status text,
+    add column if not exists stripe_current_period_end bigint,
+    add column if not exists stripe_cancel_at_period_end boolean;
+
+-- Cijeli overview u jednom round tripu: business + subscriptions + plan
+create or replace function get_subscription_overview(p_business_id uuid)
+returns jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'business_id', b.id,
+        'subscription_status', b.subscription_status,
+        'stripe_status', b.stripe_status,
+        'stripe_current_period_end', b.stripe_current_period_end,
+        'stripe_cancel_at_period_end', b.stripe_cancel_at_period_end,
+        'trial_ends_at', b.trial_ends_at,
+        'used_request', s.used_request,
+        'request_limit', s.request_limit,
+        'renewal_date', s.renewal_date,
+        'plan', case when p.id is null then null else jsonb_build_object(
+            'id', p.id,
+            'name', p.name,
+            'price', p.price,
+            'request_limit', p.request_limit
+        ) end
+    )
+    from businesses b
+    left join subscriptions s on s.business_id = b.id
+    left join subscription_plans p on p.id = b.subscription_plan_id
+    where b.id = p_business_id;
+$$;
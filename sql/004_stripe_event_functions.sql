@@ -0,0 +1,115 @@
+-- Stripe webhook: svaki tip eventa se primjenjuje jednom transakcijskom funkcijom
+-- (lookup po customeru + update statusa + reset usagea u jednom round tripu).
+--
+-- Sve funkcije vraćaju pogođene businesse da app može invalidirati cache
+-- (business_id, customer_id) i lokalni quota bucket (usage_reset).
+
+create index if not exists businesses_stripe_customer_id_idx on businesses (stripe_customer_id);
+
+-- Kreiraj ili resetiraj subscriptions row (nova pretplata / novi billing ciklus)
+create or replace function reset_subscription_usage(p_business_id uuid, p_request_limit int)
+returns void
+language plpgsql
+as $$
+begin
+    update subscriptions
+       set used_request = 0,
+           request_limit = p_request_limit,
+           renewal_date = now() + interval '30 days'
+     where business_id = p_business_id;
+
+    if not found then
+        insert into subscriptions (business_id, used_request, request_limit, renewal_date)
+        values (p_business_id, 0, p_request_limit, now() + interval '30 days');
+    end if;
+end;
+$$;
+
+-- checkout.session.completed
+create or replace function stripe_checkout_completed(p_business_id uuid, p_plan_id uuid, p_subscription_id text default null)
+returns table (business_id uuid, customer_id text, usage_reset boolean)
+language plpgsql
+as $$
+declare
+    v_request_limit int;
+begin
+    select coalesce(p.request_limit, 0) into v_request_limit
+      from subscription_plans p
+     where p.id = p_plan_id;
+
+    return query
+    update businesses b
+       set subscription_status = 'active',
+           subscription_plan_id = p_plan_id,
+           stripe_subscription_id = coalesce(p_subscription_id, b.stripe_subscription_id)
+     where b.id = p_business_id
+    returning b.id, b.stripe_customer_id, true;
+
+    if found then
+        perform reset_subscription_usage(p_business_id, coalesce(v_request_limit, 0));
+    end if;
+end;
+$$;
+
+-- customer.subscription.created / updated / deleted
+create or replace function stripe_subscription_changed(
+    p_customer_id text,
+    p_subscription_id text,
+    p_status text,
+    p_current_period_end bigint default null,
+    p_cancel_at_period_end boolean default null
+)
+returns table (business_id uuid, customer_id text, usage_reset boolean)
+language sql
+as $$
+    update businesses b
+       set subscription_status = p_status,
+           stripe_subscription_id = p_subscription_id,
+           stripe_status = p_status,
+           stripe_current_period_end = p_current_period_end,
+           stripe_cancel_at_period_end = p_cancel_at_period_end
+     where b.stripe_customer_id = p_customer_id
+    returning b.id, b.stripe_customer_id, false;
+$$;
+
+-- invoice.payment_succeeded (p_reset_usage = recurring naplata, billing_reason subscription_cycle)
+create or replace function stripe_invoice_paid(p_customer_id text, p_reset_usage boolean default false)
+returns table (business_id uuid, customer_id text, usage_reset boolean)
+language plpgsql
+as $$
+declare
+    r record;
+begin
+    for r in
+        update businesses b
+           set subscription_status = 'active'
+         where b.stripe_customer_id = p_customer_id
+        returning b.id, b.stripe_customer_id, b.subscription_plan_id
+    loop
+        business_id := r.id;
+        customer_id := r.stripe_customer_id;
+        usage_reset := false;
+
+        if p_reset_usage and r.subscription_plan_id is not null then
+            perform reset_subscription_usage(
+                r.id,
+                coalesce((select p.request_limit from subscription_plans p where p.id = r.subscription_plan_id), 0)
+            );
+            usage_reset := true;
+        end if;
+
+        return next;
+    end loop;
+end;
+$$;
+
+-- invoice.payment_failed
+create or replace function stripe_invoice_failed(p_customer_id text)
+returns table (business_id uuid, customer_id text, usage_reset boolean)
+language sql
+as $$
+    update businesses b
+       set subscription_status = 'past_due'
+     where b.stripe_customer_id = p_customer_id
+    returning b.id, b.stripe_customer_id, false;
+$$;
@@ -0,0 +1,44 @@
+-- Mjesečni reset used_request za sve pretplate kojima je prošao renewal_date
+-- (jedan set-based update), neovisno o tome je li stigao invoice webhook.
+
+create index if not exists subscriptions_renewal_date_idx on subscriptions (renewal_date);
+
+-- Lease za pozadinske poslove: od više workera posao radi samo onaj koji drži lease
+create table if not exists job_leases (
+    name text primary key,
+    holder text not null,
+    expires_at timestamptz not null
+);
+
+create or replace function acquire_job_lease(p_name text, p_holder text, p_ttl_seconds int)
+returns boolean
+language plpgsql
+as $$
+begin
+    insert into job_leases as l (name, holder, expires_at)
+    values (p_name, p_holder, now() + make_interval(secs => p_ttl_seconds))
+    on conflict (name) do update
+       set holder = excluded.holder,
+           expires_at = excluded.expires_at
+     where l.expires_at < now() or l.holder = excluded.holder;
+    return found;
+end;
+$$;
+
+-- Resetira usage i pomiče renewal_date za cijeli broj ciklusa (30 dana) iza now().
+-- Samo aktivne pretplate (past_due/cancelled se ne resetiraju dok ne plate).
+create or replace function sweep_subscription_renewals()
+returns table (business_id uuid)
+language sql
+as $$
+    update subscriptions s
+       set used_request = 0,
+           renewal_date = s.renewal_date + make_interval(
+               days => 30 * (floor(extract(epoch from now() - s.renewal_date) / 2592000)::int + 1)
+           )
+      from businesses b
+     where b.id = s.business_id
+       and b.subscription_status in ('active', 'trialing')
+       and s.renewal_date <= now()
+    returning s.business_id;
+$$;
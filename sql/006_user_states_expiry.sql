@@ -0,0 +1,43 @@
+-- user_states: razgovor istječe ako korisnik ne klikne gumb / ne pošalje detalje.
+-- Istekli rowovi se na čitanju tretiraju kao da ne postoje, a pozadinski posao
+-- ih briše u batchevima. Lookup po phone pokriva user_states_phone_key (001).
+
+alter table user_states add column if not exists expires_at timestamptz;
+
+update user_states set expires_at = now() + interval '1 day' where expires_at is null;
+
+alter table user_states
+    alter column expires_at set default now() + interval '1 day',
+    alter column expires_at set not null;
+
+create index if not exists user_states_expires_at_idx on user_states (expires_at);
+
+-- Obriši najviše p_batch isteklih rowova (kratka transakcija); vraća broj obrisanih
+create or replace function purge_expired_user_states(p_batch int default 1000)
+returns int
+language sql
+as $$
+    with expired as (
+        select ctid
+          from user_states
+         where expires_at <= now()
+         limit p_batch
+           for update skip locked
+    ), deleted as (
+        delete from user_states u
+         using expired e
+         where u.ctid = e.ctid
+        returning 1
+    )
+    select count(*)::int from deleted;
+$$;
+
+create or replace function user_state_counts()
+returns table (live bigint, expired bigint)
+language sql
+stable
+as $$
+    select count(*) filter (where expires_at > now()),
+           count(*) filter (where expires_at <= now())
+      from user_states;
+$$;
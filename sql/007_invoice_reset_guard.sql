@@ -0,0 +1,43 @@
+-- invoice.payment_succeeded (subscription_cycle) i renewal sweeper (005) resetiraju
+-- isti ciklus: sweeper na renewal_date, webhook dan kasnije, pa bi se usage
+-- nulirao dvaput. Webhook sad resetira samo ako je ciklus stvarno na redu
+-- (renewal_date prošao ili unutar grace perioda); inače ga je sweeper već resetirao.
+
+create or replace function stripe_invoice_paid(p_customer_id text, p_reset_usage boolean default false)
+returns table (business_id uuid, customer_id text, usage_reset boolean)
+language plpgsql
+as $$
+declare
+    r record;
+    v_renewal_date timestamptz;
+begin
+    for r in
+        update businesses b
+           set subscription_status = 'active'
+         where b.stripe_customer_id = p_customer_id
+        returning b.id, b.stripe_customer_id, b.subscription_plan_id
+    loop
+        business_id := r.id;
+        customer_id := r.stripe_customer_id;
+        usage_reset := false;
+
+        if p_reset_usage and r.subscription_plan_id is not null then
+            select s.renewal_date into v_renewal_date
+              from subscriptions s
+             where s.business_id = r.id
+             for update;
+
+            -- Invoice može stići malo prije renewal_date (sat / sweeper interval)
+            if v_renewal_date is null or v_renewal_date <= now() + interval '2 days' then
+                perform reset_subscription_usage(
+                    r.id,
+                    coalesce((select p.request_limit from subscription_plans p where p.id = r.subscription_plan_id), 0)
+                );
+                usage_reset := true;
+            end if;
+        end if;
+
+        return next;
+    end loop;
+end;
+$$;
@@ -0,0 +1,13 @@
+-- Povrat zahtjeva potrošenog kroz consume_request_quota (002) kad se zahtjev
+-- ipak nije upisao u requests. used_request ne ide ispod 0 (usage je u
+-- međuvremenu možda resetiran).
+
+create or replace function refund_request_quota(p_business_id uuid, p_amount int default 1)
+returns table (used_request int, request_limit int)
+language sql
+as $$
+    update subscriptions s
+       set used_request = greatest(s.used_request - p_amount, 0)
+     where s.business_id = p_business_id
+    returning s.used_request, s.request_limit;
+$$;
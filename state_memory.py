@@ -1,33 +1,125 @@
 # state_memory.py
 
-from supabase import create_client
 import os
+from datetime import datetime, timedelta, timezone
+from cache import make_cache
+from supabase_client import get_supabase
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Razgovor bez aktivnosti istječe nakon USER_STATE_TTL sekundi (sql/006_user_states_expiry.sql)
+USER_STATE_TTL = float(os.getenv("USER_STATE_TTL", "86400"))
 
-def set_state(phone, profession, step, business_id):
-    supabase.table("user_states").delete().eq("phone", phone).execute()
+# Write-through cache ispred user_states. Koristi se samo s dijeljenim backendom
+# (CACHE_BACKEND=redis): in-memory cache jednog workera ne vidi promjene drugih,
+# pa se s njim state uvijek čita iz baze i cache se ni ne puni.
+state_cache = make_cache(
+    "user_states",
+    ttl=float(os.getenv("STATE_CACHE_TTL", "300")),
+    maxsize=int(os.getenv("STATE_CACHE_MAXSIZE", "10000")),
+)
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _expires_at() -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=USER_STATE_TTL)).isoformat()
+
+def _expired(row) -> bool:
+    expires_at = row.get("expires_at")
+    if not expires_at:
+        return False
+    try:
+        return datetime.fromisoformat(expires_at) <= datetime.now(timezone.utc)
+    except (TypeError, ValueError):
+        return False
 
+def _remember(phone, row):
+    if state_cache.backend.shared:
+        state_cache.set(phone, row)
+
+def _forget(phone):
+    if state_cache.backend.shared:
+        state_cache.delete(phone)
+
+def _cached_state(phone):
+    if not state_cache.backend.shared:
+        return None
+    cached = state_cache.get(phone)
+    if cached is not None and _expired(cached):
+        state_cache.delete(phone)
+        return None
+    return cached
+
+def set_state(phone, profession, step, business_id):
+    # Jedan atomarni upsert po phone (unique index, vidi sql/001_user_states_phone_unique.sql)
     data = {
         "phone": phone,
         "step": step,
         "profession": profession,
-        "business_id": business_id
+        "business_id": business_id,
+        "expires_at": _expires_at(),
     }
 
-    supabase.table("user_states").insert(data).execute()
+    result = get_supabase().table("user_states").upsert(data, on_conflict="phone").execute()
+    row = result.data[0] if result.data else None
+    _remember(phone, row)
+    return row
 
 def get_state(phone):
-    result = supabase.table("user_states").select("*").eq("phone", phone).limit(1).execute()
+    cached = _cached_state(phone)
+    if cached is not None:
+        return cached
+
+    # Istekli razgovor = nema state-a (briše ga pozadinski purge)
+    result = get_supabase().table("user_states").select("*").eq("phone", phone).gt("expires_at", _now()).limit(1).execute()
     if result.data:
+        _remember(phone, result.data[0])
         return result.data[0]
     return None
 
 def update_step(phone, new_step):
-    supabase.table("user_states").update({"step": new_step}).eq("phone", phone).execute()
+    """Promijeni step (i produlji rok) i vrati novi row (None ako state ne postoji ili je istekao)"""
+    result = (
+        get_supabase().table("user_states")
+        .update({"step": new_step, "expires_at": _expires_at()})
+        .eq("phone", phone)
+        .gt("expires_at", _now())
+        .execute()
+    )
+    row = result.data[0] if result.data else None
+    if row:
+        _remember(phone, row)
+    else:
+        _forget(phone)
+    return row
+
+def pop_state(phone, step=None):
+    """Obriši state (opcionalno samo ako je u zadanom stepu) i vrati obrisani row"""
+    # Dijeljeni cache (redis) zna step iz zadnjeg set_state / update_step bilo kojeg workera
+    if step:
+        cached = _cached_state(phone)
+        if cached is not None and cached.get("step") != step:
+            return None
+
+    query = get_supabase().table("user_states").delete().eq("phone", phone).gt("expires_at", _now())
+    if step:
+        query = query.eq("step", step)
+    result = query.execute()
+    if result.data:
+        _forget(phone)
+        return result.data[0]
+    return None
 
 def clear_state(phone):
-    supabase.table("user_states").delete().eq("phone", phone).execute()
+    _forget(phone)
+    get_supabase().table("user_states").delete().eq("phone", phone).execute()
+
+
+def purge_expired_states(batch: int) -> int:
+    """Obriši do `batch` isteklih razgovora; vraća broj obrisanih"""
+    result = get_supabase().rpc("purge_expired_user_states", {"p_batch": batch}).execute()
+    return result.data or 0
 
+def count_states() -> dict:
+    """Broj živih i isteklih (još neobrisanih) razgovora"""
+    result = get_supabase().rpc("user_state_counts", {}).execute()
+    return result.data[0] if result.data else {"live": 0, "expired": 0}
@@ -0,0 +1,54 @@
+# state_purge.py
+#
+# Pozadinsko brisanje isteklih razgovora iz user_states u kratkim batchevima
+# (sql/006_user_states_expiry.sql) + gauge živih / isteklih razgovora.
+
+import asyncio
+import logging
+import os
+
+from async_db import count_states, purge_expired_states
+from jobs import PeriodicJob
+from metrics import register_gauges
+
+log = logging.getLogger(__name__)
+
+STATE_PURGE_ENABLED = os.getenv("STATE_PURGE_ENABLED", "true").lower() in ("1", "true", "yes")
+STATE_PURGE_INTERVAL = float(os.getenv("STATE_PURGE_INTERVAL", "600"))
+STATE_PURGE_BATCH = int(os.getenv("STATE_PURGE_BATCH", "1000"))
+# Gornja granica po krugu da jedan krug ne drži DB pool predugo
+STATE_PURGE_MAX_BATCHES = int(os.getenv("STATE_PURGE_MAX_BATCHES", "50"))
+
+# Zadnje poznato stanje (osvježava se svakim krugom, ne svakim scrapeom)
+_counts = {}
+
+
+async def purge_expired() -> int:
+    deleted = 0
+    for _ in range(STATE_PURGE_MAX_BATCHES):
+        batch = await purge_expired_states(STATE_PURGE_BATCH)
+        deleted += batch
+        if batch < STATE_PURGE_BATCH:
+            break
+        # Pusti ostale DB pozive između batcheva
+        await asyncio.sleep(0)
+
+    _counts.update(await count_states())
+    if deleted:
+        log.info("🧹 Obrisani istekli razgovori", extra={"deleted": deleted, **_counts})
+    return deleted
+
+
+purge_job = PeriodicJob(
+    "user_states_purge",
+    purge_expired,
+    interval=STATE_PURGE_INTERVAL,
+    enabled=STATE_PURGE_ENABLED,
+)
+
+
+def _state_gauges() -> dict:
+    return {(kind,): value for kind, value in _counts.items()}
+
+
+register_gauges("autoping_conversations", "Živi i istekli (još neobrisani) razgovori u user_states", _state_gauges, ("state",))
@@ -0,0 +1,238 @@
+# stripe_queue.py
+#
+# Acknowledge-then-process za Stripe webhook: event se nakon provjere potpisa
+# samo upiše u lokalnu SQLite tablicu, a background consumer ga primijeni.
+# Eventi istog customera obrađuju se strogo redom, različiti customeri paralelno.
+#
+# Inbox je trajan koliko i LOCAL_DB_PATH: stripe_service uključuje ovaj mod
+# samo uz STRIPE_QUEUE_DURABLE=true (datoteka na persistent volumeu).
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from functools import partial
+
+from local_store import register_column, register_schema, run_local
+
+log = logging.getLogger(__name__)
+
+STRIPE_QUEUE_CONCURRENCY = int(os.getenv("STRIPE_QUEUE_CONCURRENCY", "8"))
+STRIPE_QUEUE_MAX_ATTEMPTS = int(os.getenv("STRIPE_QUEUE_MAX_ATTEMPTS", "10"))
+STRIPE_QUEUE_BACKOFF_MAX = float(os.getenv("STRIPE_QUEUE_BACKOFF_MAX", "300"))
+STRIPE_QUEUE_POLL_INTERVAL = float(os.getenv("STRIPE_QUEUE_POLL_INTERVAL", "1"))
+# Koliko dugo je event rezerviran za consumer koji ga je uzeo (više workera dijeli LOCAL_DB_PATH)
+STRIPE_QUEUE_CLAIM_TIMEOUT = float(os.getenv("STRIPE_QUEUE_CLAIM_TIMEOUT", "120"))
+
+register_schema("""
+create table if not exists stripe_inbox (
+    id integer primary key autoincrement,
+    event_id text not null,
+    customer text not null,
+    payload text not null,
+    attempts integer not null default 0,
+    next_attempt_at real not null,
+    claimed_until real not null default 0,
+    last_error text,
+    received_at real not null
+);
+create index if not exists stripe_inbox_customer on stripe_inbox (customer, id);
+
+create table if not exists stripe_inbox_dead (
+    id integer primary key,
+    event_id text not null,
+    customer text not null,
+    payload text not null,
+    attempts integer not null,
+    last_error text,
+    received_at real not null,
+    failed_at real not null
+);
+""")
+register_column("stripe_inbox", "claimed_until", "real not null default 0")
+
+_consumer: asyncio.Task = None
+_wakeup: asyncio.Event = None
+_stopping = False
+
+# Metrike obrade
+_processed = 0
+_failed = 0
+_last_lag = None
+
+# ========================
+# SQLite operacije
+# ========================
+
+def _insert(conn, event_id: str, customer: str, payload: str) -> int:
+    now = time.time()
+    cur = conn.execute(
+        "insert into stripe_inbox (event_id, customer, payload, next_attempt_at, received_at) values (?, ?, ?, ?, ?)",
+        (event_id, customer, payload, now, now),
+    )
+    return cur.lastrowid
+
+
+def _claim_heads(conn, limit: int) -> list:
+    """Rezerviraj najstariji event svakog customera (ako je spreman i nitko ga ne obrađuje)"""
+    now = time.time()
+    conn.execute("begin immediate")
+    try:
+        # Customer čiji je stariji event još u obradi (ili čeka retry) je blokiran
+        rows = conn.execute(
+            "select i.* from stripe_inbox i "
+            "where i.next_attempt_at <= ? and i.claimed_until <= ? and not exists ("
+            "  select 1 from stripe_inbox j where j.customer = i.customer and j.id < i.id"
+            ") order by i.id limit ?",
+            (now, now, limit),
+        ).fetchall()
+        if rows:
+            conn.executemany(
+                "update stripe_inbox set claimed_until = ? where id = ?",
+                [(now + STRIPE_QUEUE_CLAIM_TIMEOUT, row["id"]) for row in rows],
+            )
+        conn.execute("commit")
+    except Exception:
+        conn.execute("rollback")
+        raise
+    return [dict(row) for row in rows]
+
+
+def _done(conn, inbox_id: int):
+    conn.execute("delete from stripe_inbox where id = ?", (inbox_id,))
+
+
+def _retry_later(conn, inbox_id: int, attempts: int, delay: float, error: str):
+    conn.execute(
+        "update stripe_inbox set attempts = ?, next_attempt_at = ?, claimed_until = 0, last_error = ? where id = ?",
+        (attempts, time.time() + delay, error, inbox_id),
+    )
+
+
+def _dead_letter(conn, row: dict, attempts: int, error: str):
+    conn.execute("begin immediate")
+    try:
+        conn.execute(
+            "insert or replace into stripe_inbox_dead "
+            "(id, event_id, customer, payload, attempts, last_error, received_at, failed_at) "
+            "values (?, ?, ?, ?, ?, ?, ?, ?)",
+            (row["id"], row["event_id"], row["customer"], row["payload"], attempts, error,
+             row["received_at"], time.time()),
+        )
+        conn.execute("delete from stripe_inbox where id = ?", (row["id"],))
+        conn.execute("commit")
+    except Exception:
+        conn.execute("rollback")
+        raise
+
+
+def _depth(conn) -> dict:
+    depth, oldest = conn.execute("select count(*), min(received_at) from stripe_inbox").fetchone()
+    dead = conn.execute("select count(*) from stripe_inbox_dead").fetchone()[0]
+    return {"depth": depth, "oldest": oldest, "dead_letter": dead}
+
+# ========================
+# Public API
+# ========================
+
+async def enqueue_event(event, dedupe) -> bool:
+    """Trajno spremi verificirani event (obrada ide u pozadini); False ako je replay
+
+    Dedupe ključ (event.id) i inbox row upisuju se u istoj transakciji.
+    """
+    customer = event["data"]["object"].get("customer") or "_none"
+    queued = await dedupe.claim(event["id"], on_first=partial(_insert, event_id=event["id"], customer=customer, payload=json.dumps(event)))
+    if queued and _wakeup is not None:
+        _wakeup.set()
+    return queued
+
+
+async def stripe_queue_stats() -> dict:
+    stats = await run_local(_depth)
+    oldest = stats.pop("oldest")
+    stats.update({
+        "processing_lag_seconds": round(time.time() - oldest, 3) if oldest else 0,
+        "last_event_lag_seconds": _last_lag,
+        "processed": _processed,
+        "failed": _failed,
+    })
+    return stats
+
+
+async def _process(row: dict, handler, semaphore: asyncio.Semaphore):
+    try:
+        await _apply(row, handler, semaphore)
+    except Exception:
+        # Greška u inbox tablici ne smije ugasiti consumer; event ostaje rezerviran
+        # do isteka STRIPE_QUEUE_CLAIM_TIMEOUT i onda se ponovno obrađuje
+        log.exception("❌ Greška pri zapisu ishoda Stripe eventa", extra={"event_id": row["event_id"]})
+
+
+async def _apply(row: dict, handler, semaphore: asyncio.Semaphore):
+    global _processed, _failed, _last_lag
+    async with semaphore:
+        try:
+            await handler(json.loads(row["payload"]))
+        except Exception as e:
+            _failed += 1
+            attempts = row["attempts"] + 1
+            error = f"{type(e).__name__}: {e}"
+            if attempts >= STRIPE_QUEUE_MAX_ATTEMPTS:
+                log.error("💀 Stripe event u dead-letter", extra={"event_id": row["event_id"], "attempts": attempts, "error": error})
+                await run_local(_dead_letter, row, attempts, error)
+            else:
+                delay = random.uniform(0, min(STRIPE_QUEUE_BACKOFF_MAX, 2 ** attempts))
+                log.warning("🔁 Stripe event nije uspio, ponovni pokušaj", extra={
+                    "event_id": row["event_id"], "attempts": attempts, "retry_in": round(delay, 1), "error": error,
+                })
+                await run_local(_retry_later, row["id"], attempts, delay, error)
+            return
+
+        await run_local(_done, row["id"])
+        _processed += 1
+        _last_lag = round(time.time() - row["received_at"], 3)
+
+
+async def _consume(handler):
+    semaphore = asyncio.Semaphore(STRIPE_QUEUE_CONCURRENCY)
+    while not _stopping:
+        try:
+            rows = await run_local(_claim_heads, STRIPE_QUEUE_CONCURRENCY * 4)
+        except Exception:
+            log.exception("❌ Greška pri čitanju Stripe inboxa")
+            rows = []
+
+        if not rows:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=STRIPE_QUEUE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+            continue
+
+        # Jedan event po customeru u svakoj rundi → redoslijed po customeru je očuvan
+        await asyncio.gather(*(_process(row, handler, semaphore) for row in rows))
+
+
+async def start_consumer(handler):
+    global _consumer, _wakeup, _stopping
+    if _consumer is not None:
+        return
+    _stopping = False
+    _wakeup = asyncio.Event()
+    _consumer = asyncio.create_task(_consume(handler))
+
+
+async def stop_consumer(timeout: float = 10):
+    global _consumer, _stopping
+    _stopping = True
+    if _wakeup is not None:
+        _wakeup.set()
+    if _consumer is not None:
+        try:
+            await asyncio.wait_for(_consumer, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        _consumer = None
@@ -1,24 +1,77 @@
 import os
-import stripe
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from fastapi import APIRouter, HTTPException, Request
-from supabase import create_client, Client
+from supabase_client import get_supabase
 from pydantic import BaseModel
-from datetime import datetime, timedelta, timezone
-
-# Setup Stripe
-stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+from async_db import run_db
+from dedupe import stripe_events, accept_version
+import quota
+from quota import usage_flags
+from metrics import STRIPE_EVENT_SECONDS, WEBHOOK_RESULTS_TOTAL, register_gauges
+from stripe_queue import enqueue_event, start_consumer, stop_consumer, stripe_queue_stats
+from cache import plan_cache, invalidate_business
+
+log = logging.getLogger(__name__)
+
+# Stripe SDK se uvozi i konfigurira tek pri prvom korištenju (ili iz lifespana),
+# ne pri `import main` → brži start workera
+_stripe = None
+_stripe_lock = threading.Lock()
+
+
+def get_stripe():
+    global _stripe
+    if _stripe is None:
+        with _stripe_lock:
+            if _stripe is None:
+                import stripe
+                stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+                # Lokalni Stripe stub (benchmarks/run_suite.py)
+                if os.getenv("STRIPE_API_BASE"):
+                    stripe.api_base = os.getenv("STRIPE_API_BASE")
+                stripe.max_network_retries = int(os.getenv("STRIPE_MAX_NETWORK_RETRIES", "2"))
+                # RequestsClient drži keep-alive session po threadu → konekcije prema Stripeu se ponovno koriste
+                stripe.default_http_client = stripe.http_client.RequestsClient(timeout=float(os.getenv("STRIPE_TIMEOUT", "20")))
+                _stripe = stripe
+    return _stripe
+
+
+def stripe_ready() -> bool:
+    return _stripe is not None
+
+# Stripe SDK (5.x) je sinkron → pozivi idu u vlastiti pool, ne u FastAPI threadpool
+STRIPE_MAX_WORKERS = int(os.getenv("STRIPE_MAX_WORKERS", "64"))
+_stripe_executor: ThreadPoolExecutor = None
 
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://autoping.io")
 
-# Setup Supabase
-supabase: Client = create_client(
-    os.getenv("SUPABASE_URL"),
-    os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-)
+# "sync" = obradi event unutar requesta, "async" = spremi pa obradi u pozadini
+STRIPE_WEBHOOK_MODE = os.getenv("STRIPE_WEBHOOK_MODE", "sync")
+# Async vraća 200 čim je event u lokalnoj SQLite datoteci (LOCAL_DB_PATH). Na efemernoj
+# instanci inbox nestaje zajedno s njom, a Stripe ne šalje ponovno event za koji je
+# dobio 200 → async samo kad je LOCAL_DB_PATH na trajnom disku (persistent volume)
+STRIPE_QUEUE_DURABLE = os.getenv("STRIPE_QUEUE_DURABLE", "false").lower() in ("1", "true", "yes")
+_ASYNC_REFUSED = STRIPE_WEBHOOK_MODE == "async" and not STRIPE_QUEUE_DURABLE
+if _ASYNC_REFUSED:
+    STRIPE_WEBHOOK_MODE = "sync"
 
 router = APIRouter(prefix="/stripe", tags=["stripe"])
 
 
+async def run_stripe(fn, *args, **kwargs):
+    """Izvrši sinkroni Stripe poziv u Stripe thread poolu"""
+    global _stripe_executor
+    if _stripe_executor is None:
+        _stripe_executor = ThreadPoolExecutor(max_workers=STRIPE_MAX_WORKERS, thread_name_prefix="stripe")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_stripe_executor, partial(fn, *args, **kwargs))
+
+
 # --------------------------
 # Pydantic modeli
 # --------------------------
@@ -40,89 +93,85 @@ class RepurchaseRequest(BaseModel):
 # Helper funkcije
 # --------------------------
 def get_business(business_id: str):
-    result = supabase.table("businesses").select("*").eq("id", business_id).single().execute()
+    # Uvijek iz baze: checkout/upgrade odlučuju po stripe_customer_id i pretplati,
+    # a in-memory cache drugog workera ne vidi update koji je napravio ovaj worker
+    result = get_supabase().table("businesses").select("*").eq("id", business_id).single().execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Business not found")
     return result.data
 
 
 def get_plan(plan_id: str):
-    result = supabase.table("subscription_plans").select("*").eq("id", plan_id).single().execute()
+    cached = plan_cache.get(plan_id)
+    if cached:
+        return cached
+    result = get_supabase().table("subscription_plans").select("*").eq("id", plan_id).single().execute()
     if not result.data:
         raise HTTPException(status_code=404, detail="Plan not found")
+    plan_cache.set(plan_id, result.data)
     return result.data
 
 
-def get_business_by_customer(customer_id: str):
-    """Helper za webhook - dohvati business po stripe_customer_id"""
-    result = supabase.table("businesses").select("*").eq("stripe_customer_id", customer_id).single().execute()
-    return result.data
-
+def update_business(business_id: str, data: dict):
+    get_supabase().table("businesses").update(data).eq("id", business_id).execute()
+    invalidate_business(business_id)
 
-def ensure_subscription_row(business_id: str, request_limit: int):
-    """Kreiraj ili ažuriraj subscription row za tracking usage-a"""
-    existing = supabase.table("subscriptions").select("id").eq("business_id", business_id).single().execute()
 
-    renewal_date = (datetime.now(timezone.utc) + timedelta(days=30)).isoformat()
-
-    if existing.data:
-        # Reset usage pri novoj pretplati
-        supabase.table("subscriptions").update({
-            "used_request": 0,
-            "request_limit": request_limit,
-            "renewal_date": renewal_date,
-        }).eq("business_id", business_id).execute()
-    else:
-        # Kreiraj novi row
-        supabase.table("subscriptions").insert({
-            "business_id": business_id,
-            "used_request": 0,
-            "request_limit": request_limit,
-            "renewal_date": renewal_date,
-        }).execute()
+def update_request_limit(business_id: str, request_limit: int):
+    get_supabase().table("subscriptions").update({
+        "request_limit": request_limit
+    }).eq("business_id", business_id).execute()
+    quota.reset(business_id)
 
 
 # --------------------------
 # Endpoint: Kreiraj Checkout Session
 # --------------------------
 @router.post("/create-checkout-session")
-def create_checkout_session(request: CheckoutRequest):
-    business = get_business(request.business_id)
-    plan = get_plan(request.plan_id)
+async def create_checkout_session(request: CheckoutRequest):
+    stripe = get_stripe()
+    # Business i plan su neovisni → paralelno
+    business, plan = await asyncio.gather(
+        run_db(get_business, request.business_id),
+        run_db(get_plan, request.plan_id),
+    )
+
+    # Zapišemo plan_id i status "incomplete" (čeka plaćanje)
+    update_data = {
+        "subscription_status": "incomplete",
+        "subscription_plan_id": request.plan_id
+    }
 
     # Ako nema stripe_customer_id → kreiraj
     stripe_customer_id = business.get("stripe_customer_id")
     if not stripe_customer_id:
-        customer = stripe.Customer.create(
+        customer = await run_stripe(
+            stripe.Customer.create,
             email=business["email"],
             name=business["name"],
             phone=business.get("phone_number"),
             metadata={"business_id": request.business_id},
         )
         stripe_customer_id = customer.id
-        supabase.table("businesses").update({
-            "stripe_customer_id": stripe_customer_id
-        }).eq("id", request.business_id).execute()
-
-    # Zapišemo plan_id i status "incomplete" (čeka plaćanje)
-    supabase.table("businesses").update({
-        "subscription_status": "incomplete",
-        "subscription_plan_id": request.plan_id
-    }).eq("id", request.business_id).execute()
+        update_data["stripe_customer_id"] = stripe_customer_id
 
-    # Kreiraj checkout session
+    # Kreiraj checkout session (paralelno s upisom u bazu)
     try:
-        session = stripe.checkout.Session.create(
-            mode="subscription",
-            payment_method_types=["card"],
-            line_items=[{"price": plan["stripe_price_id"], "quantity": 1}],
-            customer=stripe_customer_id,
-            metadata={
-                "business_id": request.business_id,
-                "plan_id": request.plan_id,
-            },
-            success_url=f"{FRONTEND_URL}/dashboard?payment=success",
-            cancel_url=f"{FRONTEND_URL}/payment",
+        session, _ = await asyncio.gather(
+            run_stripe(
+                stripe.checkout.Session.create,
+                mode="subscription",
+                payment_method_types=["card"],
+                line_items=[{"price": plan["stripe_price_id"], "quantity": 1}],
+                customer=stripe_customer_id,
+                metadata={
+                    "business_id": request.business_id,
+                    "plan_id": request.plan_id,
+                },
+                success_url=f"{FRONTEND_URL}/dashboard?payment=success",
+                cancel_url=f"{FRONTEND_URL}/payment",
+            ),
+            run_db(update_business, request.business_id, update_data),
         )
         return {"checkout_url": session.url}
     except Exception as e:
@@ -133,20 +182,24 @@ def create_checkout_session(request: CheckoutRequest):
 # Endpoint: Upgrade subscription
 # --------------------------
 @router.post("/upgrade")
-def upgrade_subscription(request: UpgradeRequest):
-    business = get_business(request.business_id)
-    new_plan = get_plan(request.new_plan_id)
+async def upgrade_subscription(request: UpgradeRequest):
+    stripe = get_stripe()
+    business, new_plan = await asyncio.gather(
+        run_db(get_business, request.business_id),
+        run_db(get_plan, request.new_plan_id),
+    )
 
     if not business.get("stripe_subscription_id"):
         raise HTTPException(status_code=400, detail="No active subscription to upgrade")
 
     try:
         # Dohvati trenutni subscription item ID
-        sub = stripe.Subscription.retrieve(business["stripe_subscription_id"])
+        sub = await run_stripe(stripe.Subscription.retrieve, business["stripe_subscription_id"])
         item_id = sub["items"]["data"][0]["id"]
 
         # Modify existing Stripe subscription
-        stripe.Subscription.modify(
+        await run_stripe(
+            stripe.Subscription.modify,
             business["stripe_subscription_id"],
             cancel_at_period_end=False,
             proration_behavior="create_prorations",
@@ -156,17 +209,14 @@ def upgrade_subscription(request: UpgradeRequest):
             }],
         )
 
-        # Update DB
-        supabase.table("businesses").update({
-            "subscription_plan_id": request.new_plan_id,
-            "subscription_status": "active"
-        }).eq("id", request.business_id).execute()
-
-        # Update request limit u subscriptions tablici
-        new_limit = new_plan.get("request_limit", 0)
-        supabase.table("subscriptions").update({
-            "request_limit": new_limit
-        }).eq("business_id", request.business_id).execute()
+        # Update DB (businesses + request limit u subscriptions tablici)
+        await asyncio.gather(
+            run_db(update_business, request.business_id, {
+                "subscription_plan_id": request.new_plan_id,
+                "subscription_status": "active"
+            }),
+            run_db(update_request_limit, request.business_id, new_plan.get("request_limit", 0)),
+        )
 
         return {"status": "success", "message": "Subscription upgraded successfully"}
     except Exception as e:
@@ -177,17 +227,19 @@ def upgrade_subscription(request: UpgradeRequest):
 # Endpoint: Repurchase same plan (reset requests)
 # --------------------------
 @router.post("/repurchase")
-def repurchase_subscription(request: RepurchaseRequest):
-    business = get_business(request.business_id)
+async def repurchase_subscription(request: RepurchaseRequest):
+    stripe = get_stripe()
+    business = await run_db(get_business, request.business_id)
 
     if not business.get("subscription_plan_id"):
         raise HTTPException(status_code=400, detail="No existing plan to repurchase")
 
-    plan = get_plan(business["subscription_plan_id"])
+    plan = await run_db(get_plan, business["subscription_plan_id"])
 
     try:
         # Kreiraj checkout session za isti plan
-        session = stripe.checkout.Session.create(
+        session = await run_stripe(
+            stripe.checkout.Session.create,
             mode="subscription",
             payment_method_types=["card"],
             line_items=[{"price": plan["stripe_price_id"], "quantity": 1}],
@@ -208,82 +260,133 @@ def repurchase_subscription(request: RepurchaseRequest):
 # --------------------------
 # Endpoint: Subscription overview
 # --------------------------
-@router.get("/overview/{business_id}")
-def get_subscription_overview(business_id: str):
+def _stripe_subscription_fields(status, current_period_end=None, cancel_at_period_end=None) -> dict:
+    """Stripe polja pretplate koja čuvamo u businesses (za overview bez live Stripe poziva)"""
+    return {
+        "stripe_status": status,
+        "stripe_current_period_end": current_period_end,
+        "stripe_cancel_at_period_end": cancel_at_period_end,
+    }
+
+
+def refresh_stripe_subscription(business_id: str):
+    """Live dohvat pretplate sa Stripea i upis u businesses (?refresh=true)"""
+    stripe = get_stripe()
     business = get_business(business_id)
+    if not business.get("stripe_subscription_id"):
+        return
 
-    # Stripe podaci
-    stripe_status = None
-    current_period_end = None
-    cancel_at_period_end = None
-    if business.get("stripe_subscription_id"):
-        try:
-            subscription = stripe.Subscription.retrieve(business["stripe_subscription_id"])
-            stripe_status = subscription.status
-            current_period_end = subscription.current_period_end
-            cancel_at_period_end = subscription.cancel_at_period_end
-        except stripe.error.InvalidRequestError:
-            # Subscription je obrisan na Stripeu
-            stripe_status = "cancelled"
-
-    # Subscription tablica (usage tracking)
-    sub = {}
     try:
-        sub_result = supabase.table("subscriptions").select("*").eq("business_id", business_id).single().execute()
-        sub = sub_result.data or {}
-    except Exception:
-        pass
+        subscription = stripe.Subscription.retrieve(business["stripe_subscription_id"])
+        fields = _stripe_subscription_fields(
+            subscription.status, subscription.current_period_end, subscription.cancel_at_period_end
+        )
+    except stripe.error.InvalidRequestError:
+        # Subscription je obrisan na Stripeu
+        fields = _stripe_subscription_fields("cancelled")
 
-    limit = sub.get("request_limit")
-    used = sub.get("used_request", 0)
+    update_business(business_id, fields)
 
-    warning = None
-    if limit and limit > 0 and used >= int(limit * 0.8) and used < limit:
-        warning = "You are close to your monthly limit"
 
-    can_send = True
-    if limit and limit > 0 and used >= limit:
-        can_send = False
+@router.get("/overview/{business_id}")
+def get_subscription_overview(business_id: str, refresh: bool = False):
+    if refresh:
+        refresh_stripe_subscription(business_id)
+
+    # Business + subscriptions + plan u jednom pozivu (sql/003_subscription_overview.sql)
+    result = get_supabase().rpc("get_subscription_overview", {"p_business_id": business_id}).execute()
+    overview = result.data
+    if not overview:
+        raise HTTPException(status_code=404, detail="Business not found")
+
+    limit = overview.get("request_limit")
+    used = overview.get("used_request") or 0
 
-    # Plan info
-    plan_info = None
-    if business.get("subscription_plan_id"):
-        try:
-            plan = get_plan(business["subscription_plan_id"])
-            if plan:
-                plan_info = {
-                    "id": plan["id"],
-                    "name": plan.get("name"),
-                    "price": plan.get("price"),
-                    "request_limit": plan.get("request_limit"),
-                }
-        except Exception:
-            pass
+    flags = usage_flags(used, limit)
 
     return {
         "business_id": business_id,
-        "status": stripe_status or business.get("subscription_status", "inactive"),
-        "plan": plan_info,
+        "status": overview.get("stripe_status") or overview.get("subscription_status") or "inactive",
+        "plan": overview.get("plan"),
         "requests": {
             "used": used,
             "limit": limit if limit and limit > 0 else "unlimited",
-            "renewal_date": sub.get("renewal_date"),
-            "can_send": can_send,
-            "warning": warning,
+            "renewal_date": overview.get("renewal_date"),
+            "can_send": flags["can_send"],
+            "warning": flags["warning"],
         },
         "stripe": {
-            "current_period_end": current_period_end,
-            "cancel_at_period_end": cancel_at_period_end,
+            "current_period_end": overview.get("stripe_current_period_end"),
+            "cancel_at_period_end": overview.get("stripe_cancel_at_period_end"),
         },
-        "trial_ends_at": business.get("trial_ends_at"),
+        "trial_ends_at": overview.get("trial_ends_at"),
     }
 
 
+# --------------------------
+# Webhook: primjena eventa
+# --------------------------
+def _stripe_rpc(fn: str, params: dict) -> list:
+    return get_supabase().rpc(fn, params).execute().data or []
+
+
+def apply_stripe_event(event):
+    """Primijeni Stripe event na bazu - jedna transakcijska funkcija po tipu eventa (sql/004_stripe_event_functions.sql)"""
+    event_type = event["type"]
+    obj = event["data"]["object"]
+
+    # ─── CHECKOUT COMPLETED ───
+    if event_type == "checkout.session.completed":
+        business_id = obj["metadata"].get("business_id")
+        plan_id = obj["metadata"].get("plan_id")
+        if not (business_id and plan_id):
+            return
+        # Aktivira business i kreira/resetira subscription row za usage tracking
+        rows = _stripe_rpc("stripe_checkout_completed", {
+            "p_business_id": business_id,
+            "p_plan_id": plan_id,
+            "p_subscription_id": obj.get("subscription"),
+        })
+
+    # ─── SUBSCRIPTION CREATED / UPDATED / DELETED ───
+    elif event_type in ["customer.subscription.created", "customer.subscription.updated", "customer.subscription.deleted"]:
+        status = "cancelled" if event_type == "customer.subscription.deleted" else obj["status"]
+        rows = _stripe_rpc("stripe_subscription_changed", {
+            "p_customer_id": obj["customer"],
+            "p_subscription_id": obj["id"],
+            "p_status": status,
+            "p_current_period_end": obj.get("current_period_end"),
+            "p_cancel_at_period_end": obj.get("cancel_at_period_end"),
+        })
+
+    # ─── INVOICE PAID ───
+    elif event_type == "invoice.payment_succeeded":
+        # Ako je recurring payment (ne prvi), resetiraj usage - osim ako ga je
+        # renewal sweeper već resetirao za ovaj ciklus (sql/007_invoice_reset_guard.sql)
+        rows = _stripe_rpc("stripe_invoice_paid", {
+            "p_customer_id": obj["customer"],
+            "p_reset_usage": obj.get("billing_reason") == "subscription_cycle",
+        })
+
+    # ─── PAYMENT FAILED ───
+    elif event_type == "invoice.payment_failed":
+        rows = _stripe_rpc("stripe_invoice_failed", {"p_customer_id": obj["customer"]})
+
+    else:
+        return
+
+    for row in rows:
+        invalidate_business(row["business_id"], row.get("customer_id"))
+        if row.get("usage_reset"):
+            quota.reset(row["business_id"])
+
+
 # --------------------------
 # Endpoint: Webhook
 # --------------------------
 @router.post("/webhook")
 async def stripe_webhook(request: Request):
+    stripe = get_stripe()
     payload = await request.body()
     sig_header = request.headers.get("stripe-signature")
     endpoint_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
@@ -293,96 +396,82 @@ async def stripe_webhook(request: Request):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Webhook error: {str(e)}")
 
-    event_type = event["type"]
+    if STRIPE_WEBHOOK_MODE == "async":
+        # Potpis je provjeren → spremi event (zajedno s dedupe ključem) i odmah vrati 200 Stripeu
+        try:
+            queued = await enqueue_event(event, stripe_events)
+        except Exception:
+            WEBHOOK_RESULTS_TOTAL.inc(endpoint="stripe", result="error")
+            raise
+        if not queued:
+            WEBHOOK_RESULTS_TOTAL.inc(endpoint="stripe", result="duplicate")
+            return {"status": "duplicate"}
+        WEBHOOK_RESULTS_TOTAL.inc(endpoint="stripe", result="queued")
+        return {"status": "queued"}
+
+    # Stripe redelivery istog eventa → ne primjenjuj ponovno (npr. reset used_request)
+    if not await stripe_events.claim(event["id"]):
+        WEBHOOK_RESULTS_TOTAL.inc(endpoint="stripe", result="duplicate")
+        return {"status": "duplicate"}
 
-    # ─── CHECKOUT COMPLETED ───
-    if event_type == "checkout.session.completed":
-        session = event["data"]["object"]
-        business_id = session["metadata"].get("business_id")
-        plan_id = session["metadata"].get("plan_id")
-        subscription_id = session.get("subscription")
-
-        if business_id and plan_id:
-            # Dohvati plan za request_limit
-            try:
-                plan = get_plan(plan_id)
-                request_limit = plan.get("request_limit", 0)
-            except Exception:
-                request_limit = 0
-
-            # Update business
-            update_data = {
-                "subscription_status": "active",
-                "subscription_plan_id": plan_id,
-            }
-            if subscription_id:
-                update_data["stripe_subscription_id"] = subscription_id
-
-            supabase.table("businesses").update(update_data).eq("id", business_id).execute()
-
-            # Kreiraj/resetiraj subscription row za usage tracking
-            ensure_subscription_row(business_id, request_limit)
-
-    # ─── SUBSCRIPTION CREATED ───
-    elif event_type == "customer.subscription.created":
-        subscription = event["data"]["object"]
-        customer_id = subscription["customer"]
-
-        business = get_business_by_customer(customer_id)
-        if business:
-            supabase.table("businesses").update({
-                "subscription_status": subscription["status"],
-                "stripe_subscription_id": subscription["id"]
-            }).eq("id", business["id"]).execute()
-
-    # ─── SUBSCRIPTION UPDATED / DELETED ───
-    elif event_type in ["customer.subscription.updated", "customer.subscription.deleted"]:
-        subscription = event["data"]["object"]
-        customer_id = subscription["customer"]
-
-        status = subscription["status"]
-        if event_type == "customer.subscription.deleted":
-            status = "cancelled"
-
-        business = get_business_by_customer(customer_id)
-        if business:
-            supabase.table("businesses").update({
-                "subscription_status": status,
-                "stripe_subscription_id": subscription["id"]
-            }).eq("id", business["id"]).execute()
+    try:
+        status = await process_stripe_event(event)
+    except Exception:
+        WEBHOOK_RESULTS_TOTAL.inc(endpoint="stripe", result="error")
+        await stripe_events.release(event["id"])
+        raise
 
-    # ─── INVOICE PAID ───
-    elif event_type == "invoice.payment_succeeded":
-        invoice = event["data"]["object"]
-        customer_id = invoice["customer"]
-        subscription_id = invoice.get("subscription")
+    WEBHOOK_RESULTS_TOTAL.inc(endpoint="stripe", result=status)
+    return {"status": status}
 
-        business = get_business_by_customer(customer_id)
-        if business:
-            supabase.table("businesses").update({
-                "subscription_status": "active"
-            }).eq("id", business["id"]).execute()
-
-            # Ako je recurring payment (ne prvi), resetiraj usage
-            if invoice.get("billing_reason") == "subscription_cycle":
-                plan_id = business.get("subscription_plan_id")
-                if plan_id:
-                    try:
-                        plan = get_plan(plan_id)
-                        request_limit = plan.get("request_limit", 0)
-                        ensure_subscription_row(business["id"], request_limit)
-                    except Exception:
-                        pass
 
-    # ─── PAYMENT FAILED ───
-    elif event_type == "invoice.payment_failed":
-        invoice = event["data"]["object"]
-        customer_id = invoice["customer"]
+async def process_stripe_event(event) -> str:
+    """Out-of-order provjera + primjena eventa (zove ga webhook ili background consumer)"""
+    # Stariji subscription event ne smije pregaziti noviji status
+    if event["type"].startswith("customer.subscription."):
+        subscription_id = event["data"]["object"]["id"]
+        if not await accept_version("stripe_subscription", subscription_id, event["created"]):
+            STRIPE_EVENT_SECONDS.observe(0, event_type=event["type"], result="stale")
+            return "stale"
+
+    start = time.perf_counter()
+    try:
+        await run_db(apply_stripe_event, event)
+    except Exception:
+        STRIPE_EVENT_SECONDS.observe(time.perf_counter() - start, event_type=event["type"], result="error")
+        raise
+    STRIPE_EVENT_SECONDS.observe(time.perf_counter() - start, event_type=event["type"], result="success")
+    return "success"
+
+
+async def start_stripe_worker():
+    if _ASYNC_REFUSED:
+        log.error("⛔ STRIPE_WEBHOOK_MODE=async bez STRIPE_QUEUE_DURABLE=true, webhook radi u sync modu")
+    if STRIPE_WEBHOOK_MODE == "async":
+        await start_consumer(process_stripe_event)
+
+
+async def stop_stripe_worker():
+    global _stripe_executor
+    await stop_consumer()
+    if _stripe_executor is not None:
+        _stripe_executor.shutdown(wait=True)
+        _stripe_executor = None
+
+
+async def _stripe_queue_gauges() -> dict:
+    stats = await stripe_queue_stats()
+    return {
+        ("depth",): stats["depth"],
+        ("dead_letter",): stats["dead_letter"],
+        ("processing_lag_seconds",): stats["processing_lag_seconds"],
+        ("last_event_lag_seconds",): stats["last_event_lag_seconds"],
+    }
+
+
+register_gauges("autoping_stripe_queue", "Stripe inbox (async webhook mode)", _stripe_queue_gauges, ("stat",))
 
-        business = get_business_by_customer(customer_id)
-        if business:
-            supabase.table("businesses").update({
-                "subscription_status": "past_due"
-            }).eq("id", business["id"]).execute()
 
-    return {"status": "success"}
\ No newline at end of file
+@router.get("/webhook/stats")
+async def stripe_webhook_stats():
+    return {"mode": STRIPE_WEBHOOK_MODE, **(await stripe_queue_stats())}
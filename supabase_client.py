@@ -0,0 +1,71 @@
+# supabase_client.py
+#
+# Jedan Supabase klijent za cijeli proces (state_memory, supabase_service,
+# stripe_service). Kreira se lijeno ili u FastAPI lifespanu, s podešenim
+# poolom konekcija, keep-aliveom i timeoutima, i zatvara se pri gašenju.
+
+import os
+import threading
+
+import httpx
+
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "60"))
+
+_client = None  # supabase.Client
+_http: httpx.Client = None
+_lock = threading.Lock()
+
+
+def _build():
+    # supabase-py (gotrue, postgrest, realtime, storage) je težak import → tek kad zatreba
+    from supabase import ClientOptions, create_client
+
+    global _http
+    _http = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+            keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT),
+    )
+    try:
+        # Novije verzije supabase-py primaju vlastiti httpx klijent (pool)
+        options = ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT, httpx_client=_http)
+    except TypeError:
+        _http.close()
+        _http = None
+        options = ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT)
+
+    # Env se čita tek ovdje, ne pri importu modula
+    return create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY"), options=options)
+
+
+def get_supabase():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = _build()
+    return _client
+
+
+def supabase_ready() -> bool:
+    return _client is not None
+
+
+def close_supabase():
+    """Zatvori HTTP pool Supabase klijenta (lifespan shutdown)"""
+    global _client, _http
+    with _lock:
+        if _client is not None:
+            session = getattr(_client.postgrest, "session", None)
+            if session is not None and session is not _http:
+                session.close()
+            _client = None
+        if _http is not None:
+            _http.close()
+            _http = None
@@ -1,13 +1,12 @@
-import os
+import logging
 from dotenv import load_dotenv
-from supabase import create_client
+from supabase_client import get_supabase
+from log_config import lazy_json, SAMPLED
+from cache import cache_business, get_cached_business
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+log = logging.getLogger(__name__)
 
 # ========================
 # Utils
@@ -30,32 +29,32 @@ def save_user_state(phone: str, business_id: str, profession: str, step: str):
             "profession": profession,
             "step": step
         }
-        response = supabase.table("user_states").upsert(data).execute()
-        print("💾 User state spremljen:", response)
+        response = get_supabase().table("user_states").upsert(data).execute()
+        log.debug("💾 User state spremljen", extra={"phone": phone})
         return response
-    except Exception as e:
-        print("❌ Greška pri spremanju user state:", e)
+    except Exception:
+        log.exception("❌ Greška pri spremanju user state")
         return None
 
 def get_user_state(phone: str):
     try:
         phone = _norm_phone(phone)
-        response = supabase.table("user_states").select("*").eq("phone", phone).limit(1).execute()
+        response = get_supabase().table("user_states").select("*").eq("phone", phone).limit(1).execute()
         if response.data and len(response.data) > 0:
             return response.data[0]
         return None
-    except Exception as e:
-        print("❌ Greška u get_user_state:", e)
+    except Exception:
+        log.exception("❌ Greška u get_user_state")
         return None
 
 def clear_user_state(phone: str):
     try:
         phone = _norm_phone(phone)
-        response = supabase.table("user_states").delete().eq("phone", phone).execute()
-        print("🧹 User state obrisan:", response)
+        response = get_supabase().table("user_states").delete().eq("phone", phone).execute()
+        log.debug("🧹 User state obrisan", extra={"phone": phone})
         return response
-    except Exception as e:
-        print("❌ Greška pri brisanju user state:", e)
+    except Exception:
+        log.exception("❌ Greška pri brisanju user state")
         return None
 
 # ========================
@@ -63,35 +62,80 @@ def clear_user_state(phone: str):
 # ========================
 
 def get_business_by_id(business_id: str):
+    cached = get_cached_business(business_id)
+    if cached:
+        return cached
     try:
-        response = supabase.table("businesses").select("*").eq("id", business_id).limit(1).execute()
+        response = get_supabase().table("businesses").select("*").eq("id", business_id).limit(1).execute()
         if response.data and len(response.data) > 0:
+            cache_business(response.data[0])
             return response.data[0]
         return None
-    except Exception as e:
-        print("❌ Greška u get_business_by_id:", e)
+    except Exception:
+        log.exception("❌ Greška u get_business_by_id")
         return None
 
 # ========================
 # Requests
 # ========================
 
-def save_request(phone_number: str, business_id: str, message: str, profession: str = None, request_type: str = "booking_service", priority: str = "normal", name: str = None, additional_info: dict = None):
+def build_request_row(phone_number: str, business_id: str, message: str, profession: str = None, request_type: str = "booking_service", priority: str = "normal", name: str = None, additional_info: dict = None) -> dict:
+    return {
+        "phone_number": _norm_phone(phone_number),
+        "business_id": business_id,
+        "profession": profession or "",
+        "message": message,
+        "request_type": request_type,
+        "priority": priority,
+        "name": name or "",
+        "additional_info": additional_info or {},
+        "status": "pending"
+    }
+
+def insert_requests(rows: list) -> list:
+    """Jedan multi-row insert; vraća upisane rowove istim redoslijedom (baca iznimku ako insert ne uspije)"""
+    response = get_supabase().table("requests").insert(rows).execute()
+    log.info("💾 Zahtjevi spremljeni u Supabase", extra={"rows": len(rows)})
+    log.debug("💾 Supabase odgovor: %s", lazy_json(response.data), extra=SAMPLED)
+    return response.data or []
+
+def save_request(**kwargs):
     try:
-        data = {
-            "phone_number": _norm_phone(phone_number),
-            "business_id": business_id,
-            "profession": profession or "",
-            "message": message,
-            "request_type": request_type,
-            "priority": priority,
-            "name": name or "",
-            "additional_info": additional_info or {},
-            "status": "pending"
-        }
-        response = supabase.table("requests").insert(data).execute()
-        print("💾 Zahtjev spremljen u Supabase:", response)
-        return response
-    except Exception as e:
-        print("❌ Greška pri spremanju zahtjeva:", e)
+        return insert_requests([build_request_row(**kwargs)])
+    except Exception:
+        log.exception("❌ Greška pri spremanju zahtjeva")
         return None
+
+# ========================
+# Request quota
+# ========================
+
+def consume_request_quota(business_id: str, amount: int = 1):
+    """Atomarni increment-and-check (sql/002_consume_request_quota.sql)"""
+    response = get_supabase().rpc("consume_request_quota", {"p_business_id": business_id, "p_amount": amount}).execute()
+    return response.data[0] if response.data else None
+
+def refund_request_quota(business_id: str, amount: int = 1):
+    """Vrati potrošene zahtjeve ako zahtjev nije upisan (sql/008_refund_request_quota.sql)"""
+    response = get_supabase().rpc("refund_request_quota", {"p_business_id": business_id, "p_amount": amount}).execute()
+    return response.data[0] if response.data else None
+
+def get_subscription_usage(business_id: str):
+    response = get_supabase().table("subscriptions").select("used_request, request_limit").eq("business_id", business_id).limit(1).execute()
+    if response.data and len(response.data) > 0:
+        return response.data[0]
+    return None
+
+# ========================
+# Background jobs
+# ========================
+
+def acquire_job_lease(name: str, holder: str, ttl_seconds: int) -> bool:
+    """True ako ovaj worker drži lease (sql/005_renewal_sweeper.sql)"""
+    response = get_supabase().rpc("acquire_job_lease", {"p_name": name, "p_holder": holder, "p_ttl_seconds": ttl_seconds}).execute()
+    return bool(response.data)
+
+def sweep_subscription_renewals() -> list:
+    """Resetiraj used_request svima kojima je prošao renewal_date; vraća business_id-eve"""
+    response = get_supabase().rpc("sweep_subscription_renewals", {}).execute()
+    return [row["business_id"] for row in response.data or []]
@@ -1,5 +1,6 @@
 import unicodedata
-from typing import Dict, Tuple
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Tuple
 from template_map import template_map, profession_to_template_type
 
 # Ako želiš da ne šalje krivi template, drži STRICT=True (raise umjesto tihog fallbacka)
@@ -7,6 +8,8 @@ STRICT = True
 
 VALID_STAGES = {"pm_intro", "pm_details", "pm_confirmation"}
 
+FALLBACK_TYPE = "booking_service_default"
+
 def normalize(s: str) -> str:
     s = (s or "").strip().lower()
     # makni dijakritike
@@ -18,6 +21,78 @@ def normalize(s: str) -> str:
 # Normalizirana mapa (ključevi su cleaned verzije onoga što dolazi iz UI-a)
 _NORM_PROF_TO_TYPE: Dict[str, str] = {normalize(k): v for k, v in profession_to_template_type.items()}
 
+# ========================
+# Precompiled index
+# ========================
+
+class TemplateEntry(NamedTuple):
+    template_type: str
+    name: str
+    buttons: Tuple[str, ...]  # QUICK_REPLY parametri
+
+    def template_data(self, placeholders: list = None) -> dict:
+        """Svježi templateData za jednu poruku (entry u indexu se nikad ne dijeli s payloadom)"""
+        data = {"body": {"placeholders": list(placeholders or [])}}
+        if self.buttons:
+            data["buttons"] = [{"type": "QUICK_REPLY", "parameter": b} for b in self.buttons]
+        return data
+
+
+def _compile_entry(template_type: str, stage: str) -> TemplateEntry:
+    info = template_map.get(template_type, {}).get(stage)
+    if not info:
+        raise ValueError(f"Nedostaje template za type='{template_type}', stage='{stage}'. Provjeri template_map.")
+    # Ako je samo string (stari način), nema gumba
+    if isinstance(info, str):
+        return TemplateEntry(template_type, info, ())
+    return TemplateEntry(template_type, info["name"], tuple(info.get("buttons", [])))
+
+
+def _compile_index() -> Tuple[Mapping[Tuple[str, str], TemplateEntry], Mapping[Tuple[str, str], TemplateEntry]]:
+    """Složi (profesija, stage) → TemplateEntry jednom; pada odmah ako neki stage fali"""
+    by_type = {}
+    errors = []
+    for template_type in set(profession_to_template_type.values()) | {FALLBACK_TYPE}:
+        for stage in VALID_STAGES:
+            try:
+                by_type[(template_type, stage)] = _compile_entry(template_type, stage)
+            except ValueError as e:
+                errors.append(str(e))
+    if errors:
+        raise ValueError("Neispravan template_map:\n" + "\n".join(sorted(errors)))
+
+    by_profession = {}
+    for profession, template_type in profession_to_template_type.items():
+        for stage in VALID_STAGES:
+            entry = by_type[(template_type, stage)]
+            # Točan naziv iz UI-a (brzi put) i normalizirani naziv
+            by_profession[(profession, stage)] = entry
+            by_profession[(normalize(profession), stage)] = entry
+
+    return MappingProxyType(by_profession), MappingProxyType(by_type)
+
+
+_INDEXES = None
+
+def load_templates():
+    """Složi index pri prvom korištenju; lifespan ga zove pri startu da neispravan template_map obori boot"""
+    global _INDEXES
+    if _INDEXES is None:
+        _INDEXES = _compile_index()
+    return _INDEXES
+
+def resolve_template(profession: str, stage: str) -> TemplateEntry:
+    template_index, type_index = load_templates()
+    entry = template_index.get((profession, stage)) or template_index.get((normalize(profession), stage))
+    if entry:
+        return entry
+    if stage not in VALID_STAGES:
+        raise ValueError(f"Unknown stage: {stage}")
+    if STRICT:
+        raise ValueError(f"Nepoznata profesija (nema mapiranja): '{profession}'")
+    # soft fallback ako želiš da uvijek ipak pošalje nešto
+    return type_index[(FALLBACK_TYPE, stage)]
+
 def resolve_template_type(profession: str) -> str:
     key = normalize(profession)
     ttype = _NORM_PROF_TO_TYPE.get(key)
@@ -26,35 +101,12 @@ def resolve_template_type(profession: str) -> str:
     if STRICT:
         raise ValueError(f"Nepoznata profesija (nema mapiranja): '{profession}'")
     # soft fallback ako želiš da uvijek ipak pošalje nešto
-    return "booking_service_default"
+    return FALLBACK_TYPE
 
 def get_template_name_by_profession(profession: str, stage: str) -> Tuple[str, str]:
     """
     Vraća (template_name, template_type) na temelju ljudskog naziva profesije i stage-a.
     """
-    if stage not in VALID_STAGES:
-        raise ValueError(f"Unknown stage: {stage}")
-
-    ttype = resolve_template_type(profession)
-
-    try:
-        name = template_map[ttype][stage]
-    except KeyError as e:
-        if STRICT:
-            raise KeyError(
-                f"Nedostaje template za type='{ttype}', stage='{stage}'. "
-                f"Provjeri template_map."
-            ) from e
-        # Soft fallback: pokušaj core granu po kategoriji ili default booking
-        fallback_type = "booking_service_default"
-        name = template_map[fallback_type][stage]
-        ttype = fallback_type
-
-    # ✅ Debug printovi s ispravnom varijablom
-    print("✅ template_type:", ttype, "| stage:", stage, "| keys:", list(template_map.keys()))
-    print("✅ stage:", stage)
-    print("✅ template_map keys:", list(template_map.keys()))
-
-    return name, ttype
-
+    entry = resolve_template(profession, stage)
+    return entry.name, entry.template_type
 
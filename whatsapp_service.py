@@ -1,80 +1,177 @@
 import os
+import asyncio
+import logging
+import time
 import httpx
 from dotenv import load_dotenv
-from template_map import template_map, profession_to_template_type
+from batching import MicroBatcher
+from log_config import lazy_json, SAMPLED
+from metrics import INFOBIP_SECONDS, TEMPLATES_TOTAL, register_gauges
+from template_utils import resolve_template
 
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 INFOBIP_API_KEY = os.getenv("INFOBIP_API_KEY")
 INFOBIP_BASE_URL = os.getenv("INFOBIP_BASE_URL")
 INFOBIP_SENDER = os.getenv("INFOBIP_WHATSAPP_NUMBER")
 
-# === Slanje WhatsApp template poruke ===
-async def send_whatsapp_template(to_number: str, profession: str, stage: str, placeholders: list = None):
-    if not to_number.startswith("+"):
-        to_number = f"+{to_number}"
+# === HTTP klijent (pool) ===
+INFOBIP_HTTP2 = os.getenv("INFOBIP_HTTP2", "true").lower() in ("1", "true", "yes")
+INFOBIP_MAX_CONNECTIONS = int(os.getenv("INFOBIP_MAX_CONNECTIONS", "100"))
+INFOBIP_MAX_KEEPALIVE = int(os.getenv("INFOBIP_MAX_KEEPALIVE", "20"))
+INFOBIP_KEEPALIVE_EXPIRY = float(os.getenv("INFOBIP_KEEPALIVE_EXPIRY", "30"))
+INFOBIP_TIMEOUT = float(os.getenv("INFOBIP_TIMEOUT", "10"))
+INFOBIP_CONNECT_TIMEOUT = float(os.getenv("INFOBIP_CONNECT_TIMEOUT", "5"))
+
+# === Bulk slanje (više poruka u jednom Infobip requestu) ===
+INFOBIP_BATCH_ENABLED = os.getenv("INFOBIP_BATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+INFOBIP_BATCH_MAX = int(os.getenv("INFOBIP_BATCH_MAX", "50"))
+INFOBIP_BATCH_WINDOW_MS = float(os.getenv("INFOBIP_BATCH_WINDOW_MS", "10"))
+
+_client: httpx.AsyncClient = None
+_batcher: MicroBatcher = None
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=INFOBIP_BASE_URL or "",
+        headers={
+            "Authorization": f"App {INFOBIP_API_KEY}",
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        },
+        http2=INFOBIP_HTTP2,
+        limits=httpx.Limits(
+            max_connections=INFOBIP_MAX_CONNECTIONS,
+            max_keepalive_connections=INFOBIP_MAX_KEEPALIVE,
+            keepalive_expiry=INFOBIP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(INFOBIP_TIMEOUT, connect=INFOBIP_CONNECT_TIMEOUT),
+    )
+
 
-    # Dohvati tip templatea prema profesiji
-    template_type = profession_to_template_type.get(profession)
-    if not template_type:
-        raise ValueError(f"Nepoznata profession: {profession}")
+async def start_infobip_client():
+    """Otvori dijeljeni Infobip klijent (poziva se iz FastAPI lifespana)"""
+    global _client
+    if _client is None:
+        _client = _build_client()
 
-    # Dohvati template info
-    template_info = template_map.get(template_type, {}).get(stage)
-    if not template_info:
-        raise ValueError(
-            f"Nedostaje template za type='{template_type}', stage='{stage}'. Provjeri template_map."
+
+async def close_infobip_client():
+    """Zatvori dijeljeni Infobip klijent i sve keep-alive konekcije"""
+    global _client, _batcher
+    if _batcher is not None:
+        await _batcher.close()
+        _batcher = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def infobip_client_ready() -> bool:
+    return _client is not None
+
+
+def get_infobip_client() -> httpx.AsyncClient:
+    # Fallback za skripte koje ne prolaze kroz lifespan
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def _get_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        _batcher = MicroBatcher(
+            _post_messages,
+            max_batch=INFOBIP_BATCH_MAX,
+            max_delay=INFOBIP_BATCH_WINDOW_MS / 1000,
+            name="infobip_template",
         )
+    return _batcher
 
-    # Ako je samo string (stari način), pretvori u dict
-    if isinstance(template_info, str):
-        template_name = template_info
-        buttons = []
-    else:
-        template_name = template_info["name"]
-        buttons = template_info.get("buttons", [])
 
-    print(f"[WA][TEMPLATE] stage={stage} type={template_type} name={template_name} → {to_number}")
+def _batch_stats() -> dict:
+    if _batcher is None:
+        return {}
+    stats = _batcher.stats()
+    return {("batches",): stats["batches"], ("messages",): stats["items"]}
 
-    # === Složi payload prema Infobip specifikaciji ===
-    template_data = {
-        "body": {"placeholders": placeholders or []}  # ✅ ubaci ime obrta ili prazno
-    }
 
-    # Dodaj gumbe ako postoje
-    if buttons:
-        template_data["buttons"] = [
-            {"type": "QUICK_REPLY", "parameter": b} for b in buttons
-        ]
-
-    payload = {
-        "messages": [
-            {
-                "from": INFOBIP_SENDER,
-                "to": to_number,
-                "content": {
-                    "templateName": template_name,
-                    "templateData": template_data,
-                    "language": "hr"
-                }
-            }
-        ]
-    }
+register_gauges("autoping_infobip_batch_total", "Infobip bulk requesti i poruke u njima", _batch_stats, ("kind",))
 
-    print(f"[WA][REQ] {payload}")
 
-    headers = {
-        "Authorization": f"App {INFOBIP_API_KEY}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
+async def _post_messages(messages: list) -> list:
+    """Jedan Infobip request s više poruka; vraća rezultat po poruci (istim redoslijedom)"""
+    payload = {"messages": messages}
+    log.debug("[WA][REQ] %s", lazy_json(payload), extra=SAMPLED)
+
+    start = time.perf_counter()
+    resp = await get_infobip_client().post("/whatsapp/1/message/template", json=payload)
+    INFOBIP_SECONDS.observe(time.perf_counter() - start, status=resp.status_code)
+    log.info("[WA][RES]", extra={"status": resp.status_code, "messages": len(messages)})
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("[WA][RES] %s", resp.text, extra=SAMPLED)
+
+    # Jedna neispravna poruka ne smije oboriti cijeli batch → pošalji ih pojedinačno
+    if 400 <= resp.status_code < 500 and resp.status_code != 429 and len(messages) > 1:
+        singles = await asyncio.gather(*(_post_messages([m]) for m in messages), return_exceptions=True)
+        return [r if isinstance(r, Exception) else r[0] for r in singles]
+
+    resp.raise_for_status()
+
+    body = resp.json()
+    statuses = body.get("messages", [])
+    results = []
+    for i, message in enumerate(messages):
+        if i < len(statuses):
+            results.append({"messages": [statuses[i]], "bulkId": body.get("bulkId")})
+        else:
+            results.append(RuntimeError(f"Infobip nije vratio status za poruku → {message['to']}"))
+    return results
+
+
+def build_template_message(to_number: str, profession: str, stage: str, placeholders: list = None) -> dict:
+    """Složi jednu poruku prema Infobip specifikaciji"""
+    if not to_number.startswith("+"):
+        to_number = f"+{to_number}"
+
+    # Template iz precompiled indexa (validiran pri importu)
+    template = resolve_template(profession, stage)
+
+    log.info("[WA][TEMPLATE]", extra={"stage": stage, "template_type": template.template_type, "template": template.name})
+    TEMPLATES_TOTAL.inc(template_type=template.template_type, stage=stage)
+
+    # ✅ ime obrta (ili prazno) u placeholderima, gumbi ako postoje
+    template_data = template.template_data(placeholders)
+
+    return {
+        "from": INFOBIP_SENDER,
+        "to": to_number,
+        "content": {
+            "templateName": template.name,
+            "templateData": template_data,
+            "language": "hr"
+        }
     }
 
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            f"{INFOBIP_BASE_URL}/whatsapp/1/message/template",
-            headers=headers,
-            json=payload,
-        )
-        print(f"[WA][RES] {resp.status_code} {resp.text}")
-        resp.raise_for_status()
-        return resp.json()
+
+async def send_message(message: dict):
+    """Pošalji već složenu poruku (koristi je i outbox worker)"""
+    # Poruke iz istog prozora od INFOBIP_BATCH_WINDOW_MS idu jednim requestom
+    if INFOBIP_BATCH_ENABLED:
+        return await _get_batcher().submit(message)
+
+    results = await _post_messages([message])
+    if isinstance(results[0], Exception):
+        raise results[0]
+    return results[0]
+
+
+# === Slanje WhatsApp template poruke ===
+async def send_whatsapp_template(to_number: str, profession: str, stage: str, placeholders: list = None):
+    message = build_template_message(to_number, profession, stage, placeholders)
+    return await send_message(message)